@@ -0,0 +1,313 @@
+## Benchmarks
+#
+# Benchmarks of the model solvers (modelproject.py), the square engine (inauguralproject.py) and the
+# stages of the COVID-19 data pipeline (dataproject.py) on synthetic data of a given size. The time and
+# peak memory of each benchmark are appended to a results file, and compared to a stored baseline.
+
+import os
+import sys
+import json
+import time
+import datetime
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+for project in ['inauguralproject', 'modelproject', 'dataproject']:
+    sys.path.insert(0, os.path.join(ROOT, project))
+
+import inauguralproject
+import modelproject
+import dataproject
+
+# results of all runs (one JSON line per benchmark) and the baseline the latest run is compared to
+RESULTS = os.path.join(HERE, 'results.jsonl')
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+# a benchmark has regressed if it is slower than TIME_TOLERANCE or uses more memory than MEMORY_TOLERANCE times the baseline
+TIME_TOLERANCE = 1.25
+MEMORY_TOLERANCE = 1.10
+
+# differences below these (seconds and MB) are noise and never flagged
+TIME_FLOOR = 1e-3
+MEMORY_FLOOR = 1.0
+
+# default size of the inputs: grid points of the model benchmarks, and countries and days of the data benchmarks
+SIZES = {'n': 10**6, 'countries': 50, 'days': 120}
+
+
+### Synthetic data
+
+def synthetic_covid(countries, days, seed=0):
+    """ synthetic COVID-19 data in the format of load_covid()
+
+    Each country has an epidemic with its own growth rate and start date, daily cases are
+    Poisson distributed and about 5 percent of the cases die.
+
+    Args:
+
+        countries (int): number of countries, the first is USA
+        days (int): number of days from the 1st of March 2020
+        seed (int): seed of the random numbers
+
+    Returns:
+
+        covid (DataFrame): one row per country and day sorted by date and country
+
+    """
+
+    rng = np.random.default_rng(seed)
+    codes = ['USA'] + [f'C{i:03d}' for i in range(1, countries)]
+    dates = pd.date_range('2020-03-01', periods=days)
+
+    # a. epidemic curves, (days x countries)
+    t = np.arange(days)[:, None] - rng.uniform(0, days/4, countries)
+    rate = rng.uniform(0.05, 0.3, countries)
+    peak = rng.uniform(days/3, days, countries)
+    intensity = np.exp(np.clip(rate*np.minimum(t, peak) - rate*np.maximum(t - peak, 0), None, 12))*(t > 0)
+    cases = rng.poisson(intensity)
+    deaths = rng.binomial(cases, 0.05)
+
+    # b. long format
+    covid = pd.DataFrame({'date': np.repeat(dates, countries),
+                          'day': np.repeat(dates.day, countries).astype('int8'),
+                          'month': np.repeat(dates.month, countries).astype('int8'),
+                          'year': np.repeat(dates.year, countries).astype('int16'),
+                          'cases': cases.ravel().astype('int32'),
+                          'deaths': deaths.ravel().astype('int32'),
+                          'country': pd.Categorical(np.tile(codes, days), categories=sorted(codes)),
+                          'popData2018': np.tile(rng.integers(10**5, 10**8, countries), days)})
+    return covid
+
+def synthetic_market(days, seed=0):
+    """ synthetic S&P 500 index on weekdays in the format of load('sp500') """
+
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2020-03-01', periods=max(days*5//7, 1))
+    return pd.DataFrame({'date': dates,
+                         'SP500': 3000*np.exp(np.cumsum(rng.normal(0, 0.02, dates.size))),
+                         'country': pd.Categorical(['USA']*dates.size)})
+
+def write_ecdc(covid, path):
+    """ write synthetic data as an ECDC workbook, see dataproject.read_covid() """
+
+    ecdc = covid.rename(columns={'country': 'countryterritoryCode', 'date': 'dateRep'})
+    ecdc['countriesAndTerritories'] = ecdc['countryterritoryCode']
+    ecdc['geoId'] = ecdc['countryterritoryCode'].astype(str).str[:2]
+    ecdc.to_excel(path, index=False)
+
+
+### Benchmarks
+
+def _firm_grid(n):
+    """ parameter vectors of a firm grid with about n points """
+
+    m = max(int(round(n**0.25)), 1)
+    return np.linspace(1, 10, m), np.linspace(0.5, 2, m), np.linspace(0.5, 2, m), np.linspace(0, 5, m)
+
+def _model_benchmarks(sizes, tmp):
+    """ benchmarks of modelproject.py and inauguralproject.py """
+
+    rng = np.random.default_rng(0)
+    n = sizes['n']
+    I, p_1, p_2 = rng.uniform(10, 30, n), rng.uniform(1, 5, n), rng.uniform(0.5, 2, n)
+    p, w, r, FC = _firm_grid(n)
+    P, W, R, F = np.meshgrid(p, w, r, FC, indexing='ij', sparse=True)
+    x = rng.random(n)
+    out = np.empty_like(x)
+
+    return {'consumer_np': lambda: modelproject.consumer_np(I, p_1, p_2),
+            'consumer_bisect': lambda: modelproject.consumer_bisect(I[:n//10], p_1[:n//10], p_2[:n//10]),
+            'firm_np': lambda: modelproject.firm_np(P, W, R, F),
+            'firm_sweep': lambda: modelproject.firm_sweep(p, w, r, FC, os.path.join(tmp, 'firm_sweep'), workers=1),
+            'square': lambda: inauguralproject.square(x, out=out)}
+
+def _data_benchmarks(sizes, tmp):
+    """ benchmarks of the stages of dataproject.py """
+
+    covid = synthetic_covid(sizes['countries'], sizes['days'])
+    market = synthetic_market(sizes['days'])
+    xlsx = os.path.join(tmp, 'covid.xlsx')
+    write_ecdc(covid, xlsx)
+    dataproject.load_covid(xlsx, cache_dir=tmp)
+
+    cleaned = dataproject.add_growth(dataproject.add_totals(covid.copy()))
+    covid_stocks = dataproject.asof_join(cleaned, dataproject.market_index([market]), how='inner')
+
+    return {'load_xlsx': lambda: dataproject.read_covid(xlsx),
+            'load_parquet': lambda: dataproject.load_covid(xlsx, cache_dir=tmp),
+            'wide_format': lambda: dataproject.wide_format(covid),
+            'add_totals': lambda: dataproject.add_totals(covid.copy()),
+            'add_growth': lambda: dataproject.add_growth(covid.copy()),
+            'covid_summary': lambda: dataproject.covid_summary(cleaned, per_capita=True),
+            'covid_source': lambda: dataproject.covid_source(cleaned),
+            'asof_join': lambda: dataproject.asof_join(cleaned, dataproject.market_index([market]), how='inner'),
+            'market_regressions': lambda: dataproject.market_regressions(covid_stocks)}
+
+# groups of benchmarks, each a function of the sizes and a temporary folder returning {name: callable}
+BENCHMARKS = {'model': _model_benchmarks, 'data': _data_benchmarks}
+
+def measure(func, repeat=3):
+    """ time and peak memory of a function
+
+    Args:
+
+        func (callable): function without arguments
+        repeat (int): number of timed calls, the fastest is used
+
+    Returns:
+
+        result (dict): 'time' in seconds and 'peak_mb', the peak of memory allocated during a separate call in MB
+
+    """
+
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'time': min(times), 'peak_mb': peak/2**20}
+
+def run(sizes=SIZES, groups=None, only=None, repeat=3):
+    """ run the benchmarks
+
+    Args:
+
+        sizes (dict): 'n' grid points, 'countries' and 'days' of the synthetic data
+        groups (list): groups in BENCHMARKS to run, default is all
+        only (list): names of the benchmarks to run, default is all
+        repeat (int): number of timed calls of each benchmark
+
+    Returns:
+
+        results (list): one dict per benchmark with the name, sizes, time and peak memory
+
+    """
+
+    sizes = {**SIZES, **sizes}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for group in groups or list(BENCHMARKS):
+            for name, func in BENCHMARKS[group](sizes, tmp).items():
+                if only is not None and name not in only:
+                    continue
+                result = {'name': f'{group}.{name}', 'sizes': sizes}
+                result.update(measure(func, repeat=repeat))
+                results.append(result)
+                print(f"{result['name']:28s} {result['time']:10.4f}s {result['peak_mb']:10.1f} MB", flush=True)
+    return results
+
+
+### Results over time
+
+def environment():
+    """ commit, time and versions identifying a run """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'machine': platform.node(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__}
+
+def store(results, path=RESULTS):
+    """ append results to a JSON lines file """
+
+    env = environment()
+    with open(path, 'a') as f:
+        for result in results:
+            f.write(json.dumps({**env, **result}) + '\n')
+
+def history(path=RESULTS):
+    """ all stored results as a DataFrame, one row per run and benchmark """
+
+    return pd.read_json(path, lines=True)
+
+def save_baseline(results, path=BASELINE):
+    """ store results as the baseline """
+
+    with open(path, 'w') as f:
+        json.dump({result['name']: {**environment(), **result} for result in results}, f, indent=1)
+
+def compare(results, path=BASELINE, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """ flag regressions against the baseline
+
+    Benchmarks are only compared to a baseline with the same sizes. Differences below
+    TIME_FLOOR and MEMORY_FLOOR are not flagged.
+
+    Args:
+
+        results (list): results of run()
+        path (str): baseline file, see save_baseline()
+        time_tolerance (float): maximum ratio of time to the baseline
+        memory_tolerance (float): maximum ratio of peak memory to the baseline
+
+    Returns:
+
+        regressions (list): (name, measure, ratio) of each regression
+
+    """
+
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None or base['sizes'] != result['sizes']:
+            continue
+        for key, tolerance, floor in [('time', time_tolerance, TIME_FLOOR), ('peak_mb', memory_tolerance, MEMORY_FLOOR)]:
+            ratio = result[key]/base[key] if base[key] > 0 else np.inf
+            if ratio > tolerance and result[key] - base[key] > floor:
+                regressions.append((result['name'], key, ratio))
+    return regressions
+
+
+### Command line
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the model solvers and the COVID-19 data pipeline on synthetic data.')
+    parser.add_argument('--n', type=int, default=SIZES['n'], help='grid points of the model benchmarks')
+    parser.add_argument('--countries', type=int, default=SIZES['countries'], help='countries of the synthetic data')
+    parser.add_argument('--days', type=int, default=SIZES['days'], help='days of the synthetic data')
+    parser.add_argument('--group', nargs='+', choices=list(BENCHMARKS), help='groups to run, default is all')
+    parser.add_argument('--only', nargs='+', help='benchmarks to run, default is all')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls of each benchmark')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--no-store', action='store_true', help='do not append the results to the results file')
+    args = parser.parse_args()
+
+    results = run({'n': args.n, 'countries': args.countries, 'days': args.days},
+                  groups=args.group, only=args.only, repeat=args.repeat)
+    if not args.no_store:
+        store(results)
+
+    if args.save_baseline:
+        save_baseline(results)
+        print(f'baseline stored in {BASELINE}')
+    else:
+        regressions = compare(results)
+        for name, key, ratio in regressions:
+            print(f'REGRESSION {name}: {key} is {ratio:.2f} times the baseline')
+        sys.exit(1 if regressions else 0)
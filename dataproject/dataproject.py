@@ -1,436 +1,1524 @@
-# To add a new cell, type '# %%'
-# To add a new markdown cell, type '# %% [markdown]'
-# %%
-from IPython import get_ipython
-
-# %%
+## Data Project
+#
+# The outbreak of COVID-19 in selected countries.
+#
+# The functions used in dataproject.ipynb are collected here. The module does not need IPython and
+# does not open figures, such that it can run unattended. Running the file as a script builds the report:
+# the data is loaded, cleaned and aggregated, and the charts are written to files, see report().
+
+import os
+import sys
+import json
+import hashlib
+import warnings
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import ipywidgets as widgets
-import itertools
-import operator
 from pandas.plotting import register_matplotlib_converters
-register_matplotlib_converters()
-
-# autoreload modules when code is run
-get_ipython().run_line_magic('load_ext', 'autoreload')
-get_ipython().run_line_magic('autoreload', '2')
-
-# %% [markdown]
-# ### **Read and clean data**
-# 
-# **Reading the relevant data** from European Center for Disease Control. The data includes COVID-19 Cases and Deaths for all countries.
-# 
-# Renaming colums and keeping data only for the 5 selected countries. Furthermore, the spread of COVID-19 in Europe and the US did not significantly take place before early March 2020 - as such we only focus on data from March and April 2020.
-# 
-# When considering the number of cases in the data, it is important to note, that different countries employ different strategies with respect to testing. As such, if a country tests rigorously it is bound to record more cases related to COVID-19. Therefore, we also consider the number of deaths related to COVID-19. Deaths related to COVID-19 can be considered as a constant rate of the *true* number of infected. Furthermore, it will not be conditioned on the number of tests being performed by each country.
-
-# %%
-# a. load
-url = 'https://www.ecdc.europa.eu/sites/default/files/documents/COVID-19-geographic-disbtribution-worldwide-2020-04-22.xlsx'
-covid = pd.read_excel(url)
-
-#In case of the URL not working, the dataframe can be loaded from the excel file provided:
-#df = pd.read_excel('Covid_Data.xlsx')
-
-# b. rename columns
-covid.rename(columns = {'countryterritoryCode':'country', 'dateRep':'date'}, inplace=True)
-
-drop_these = ['year', 'countriesAndTerritories', 'geoId', 'popData2018']
-covid.drop(drop_these, axis=1, inplace=True) # axis = 1 -> columns, inplace=True -> changed, no copy made
-covid.head(5)
-
-#c. keeping the 5 relevant countries to be analyzed
-array = ['ITA', 'ESP', 'DNK', 'SWE', 'USA']
-covid = covid.loc[covid['country'].isin(array)]
-
-#d. keeping the months of interest (March & April)
-array2 = [3, 4]
-covid = covid.loc[covid['month'].isin(array2)].reset_index()
-drop_these = ['index']
-covid.drop(drop_these, axis=1, inplace=True)
-
-covid.head()
-
-# %% [markdown]
-# The order of the data is reversed, such that index 0 corresponds to the first date (1st of March) in our data.
-
-# %%
-covid = covid.iloc[::-1].reset_index()
-drop_these = ['index']
-covid.drop(drop_these, axis=1, inplace=True)
-covid.head()
-
-# %% [markdown]
-# To initially plot the number of confirmed COVID-19 cases and deaths in each country, we reformat the data as follows. Moreover, we are interested in accumulative data i.e. total number of cases and deaths on a given day. This is stored in covid_red.
-
-# %%
-covid_ref = pd.DataFrame()
-#e. reformatting data for use in initial graphs
-for country, group in covid.groupby("country"):
-    if covid_ref.empty:
-        covid_ref = group.set_index("date")[["cases", "deaths"]].rename(columns={"cases":country + " cases", "deaths":country + " deaths"})
-    else:
-        covid_ref = covid_ref.join(group.set_index("date")[["cases", "deaths"]].rename(columns={"cases":country + " cases", "deaths":country + " deaths"}))
-
-#f. accumulative data
-covid_ref = covid_ref.sort_values(by='date').cumsum()
-covid_ref.head()
-
-# %% [markdown]
-# The original dataframe, 'covid', is extended with a column for total cases and total deaths.
-
-# %%
-covid['total_cases'] = covid.groupby('country')['cases'].transform(pd.Series.cumsum)
-covid['total_deaths'] = covid.groupby('country')['deaths'].transform(pd.Series.cumsum)
-covid.head()
-
-# %% [markdown]
-# **Descriptives** on daily cases and deaths showing average number of new daily cases and deaths.
-
-# %%
-covid.groupby('country')['cases', 'deaths'].mean().round(1)
-
-# %% [markdown]
-# **Descriptives** on cases and deaths showing the highest number of recorded cases on a given day in the selected countries. This clearly shows the disparity between Sweden and Denmark, with Sweden having recorded 185 deaths on the worst day, and Denmark recording no more than 22 deaths.
-
-# %%
-covid.groupby('country')['cases', 'deaths'].max().round(1)
-
-# %% [markdown]
-# **Desciptives** showing total number of cases and deaths on date of writing (22.04.2020). Sweden records almost five times as many deaths as Denmark. The severity of the outbreak in Spain and Italy appears very similar with more or less 200.000 confirmed cases and more than 20.000 deaths. The numbers for the United States indicate a critical situation.
-
-# %%
-covid.groupby('country')['total_cases', 'total_deaths'].max().round(1)
-
-# %% [markdown]
-# We note, the numbers for the United States eclipse those of the 4 other countries in our dataset. Both with respect to daily numbers and the total figure, the United States records more deaths and cases than any other country. This, despite the pandemic reaching Europe and especially Italy much earlier. 
-# 
-# Italy was intially the hardest hit country in Europe and still records the highest number of deaths. However, the data indicates Spain has caught up to Italy given the larger number of recorded cases. 
-# 
-# In many ways Denmark and Sweden are similar - demographically and culturally. The approaches of the two governments have differed, with Denmark opting for much more strict guidelines. The population density in Sweden is much lower than that of Denmark, as all other things equal one could expect *lower* numbers per capita in both cases and especially deaths in Sweden - this is not the case.
-# %% [markdown]
-# ***Plotting number of confirmed COVID-19 cases (left axis) and confirmed COVID-19 deaths (right axis) for the 5 countries***
-
-# %%
-fig = plt.figure(figsize=(10,40))
-
-color = 'tab:red'
-ax = fig.add_subplot(5,1,1)
-ax.plot(covid_ref['DNK cases'], color=color, label='Total Cases')
-ax.set_ylabel('Total Cases')
-ax.set_xlabel('Date')
-ax.legend(loc='upper left')
-
-ax2 = ax.twinx()
-
-color = 'tab:blue'
-ax2.set_ylabel('Total Deaths')
-ax2.plot(covid_ref['DNK deaths'], color=color, label='Total Deaths')
-ax2.set_xlabel('Date')
-ax2.grid(True)
-ax2.legend(loc='upper center')
-plt.title('Figure 1: COVID-19 Related Cases and Deaths in Denmark')
-
-color = 'tab:red'
-ax = fig.add_subplot(5,1,2)
-ax.plot(covid_ref['SWE cases'], color=color, label='Total Cases')
-ax.set_ylabel('Total Cases')
-ax.set_xlabel('Date')
-ax.legend(loc='upper left')
-
-ax2 = ax.twinx()
-
-color = 'tab:blue'
-ax2.set_ylabel('Total Deaths')
-ax2.plot(covid_ref['SWE deaths'], color=color, label='Total Deaths')
-ax2.set_xlabel('Date')
-ax2.grid(True)
-ax2.legend(loc='upper center')
-plt.title('Figure 2: COVID-19 Related Cases and Deaths in Sweden')
-
-color = 'tab:red'
-ax = fig.add_subplot(5,1,3)
-ax.plot(covid_ref['ITA cases'], color=color, label='Total Cases')
-ax.set_ylabel('Total Cases')
-ax.set_xlabel('Date')
-ax.legend(loc='upper left')
-
-ax2 = ax.twinx()
-
-color = 'tab:blue'
-ax2.set_ylabel('Total Deaths')
-ax2.plot(covid_ref['ITA deaths'], color=color, label='Total Deaths')
-ax2.set_xlabel('Date')
-ax2.grid(True)
-ax2.legend(loc='upper center')
-plt.title('Figure 3: COVID-19 Related Cases and Deaths in Italy')
-
-color = 'tab:red'
-ax = fig.add_subplot(5,1,4)
-ax.plot(covid_ref['ESP cases'], color=color, label='Total Cases')
-ax.set_ylabel('Total Cases')
-ax.set_xlabel('Date')
-ax.legend(loc='upper left')
-
-ax2 = ax.twinx()
-
-color = 'tab:blue'
-ax2.set_ylabel('Total Deaths')
-ax2.plot(covid_ref['ESP deaths'], color=color, label='Total Deaths')
-ax2.set_xlabel('Date')
-ax2.grid(True)
-ax2.legend(loc='upper center')
-plt.title('Figure 4: COVID-19 Related Cases and Deaths in Spain')
-
-color = 'tab:red'
-ax = fig.add_subplot(5,1,5)
-ax.plot(covid_ref['USA cases'], color=color, label='Total Cases')
-ax.set_ylabel('Total Cases')
-ax.set_xlabel('Date')
-ax.legend(loc='upper left')
-
-ax2 = ax.twinx()
-
-color = 'tab:blue'
-ax2.set_ylabel('Total Deaths')
-ax2.plot(covid_ref['USA deaths'], color=color, label='Total Deaths')
-ax2.set_xlabel('Date')
-ax2.grid(True)
-ax2.legend(loc='upper center')
-plt.title('Figure 5: COVID-19 Related Cases and Deaths in the United States')
-plt.figtext(0.5, 0.1, "Source: European Center for Disease Control", ha="center", fontsize=8, bbox={"facecolor":"cyan", "alpha":1, "pad":9})
-
-plt.show()
-
-# %% [markdown]
-# In order to combat the outbreak of COVID-19, the analyzed countries have adopted several approaches varying in strictness. Plotting the number recorded cases and deaths against time for the months of March and April can help us understand the spread of COVID-19 in the selected countries. The graphical analysis is relevant, as the approaches aim to avoid exponential growth in the spread of COVID-19. In our case, exponential growth would occur when every contaminated individual infects *more* than 1 person.
-# 
-# The initial growth in the number of reported cases in Denmark appears to decline significantly when compared to Sweden which data exhibits closer to expotential growth. This could both be due to the strict policy with respect to social gatherings but also be related to the testing strategy, where Denmark has been criticized for lack of testing. Levels of testing in Denmark have been increasing through late March and April, which could explain the later surge in the growth rate in Danish COVID-19 related cases - however a clear downwards shift in recorded cases can be seen throughout April. Based on Figure 1 it appears Denmark has avoided the threat of exponential growth more so than Sweden.
-# 
-# The numbers for Italy and Spain could both imply exponential growth in both the number of reported cases as well as deaths. We note Italy experienced severe growth in the number of COVID-19 patients earlier than Spain. The numbers for late March could imply a downturn in the growth of COVID-19 related cases in both Italy and Spain and a potential adjustment towards linear growth.
-# 
-# Although data for the United States implies the outbreak hit the country to a certain degree of severety later than the other countries in our data, the alarming growth in number of reported cases and deaths has secured the United States' position as the epicentre of the COVID-19 outbreak as measured by number of reported cases and deaths. This could be due to the lack of strict policy concerning e.g. social distancing and shutdowns as well as the significant increase in testing in the country.
-# %% [markdown]
-# **Plotting log-scaled confirmed cases of COVID-19**
-# 
-# A way of comparing the rate of exponetial growth between the countries is to plot the recorded COVID-19 related number on a logarithmic scale. A flatter curve indicates a decreasing growth rate in the number of cases and deaths.
-# 
-# Note: The following 4 graphs are plotted using bokeh plot tools. As such, every plot will appear in a new browser-tab.
-# 
-# A more elegant solution (first plot) enables the hover tool, however to enable a legend (with the ability of hiding a chosen contry) a less elegant approach is also presented (second plot).
-
-# %%
-#Plotting log-scale number of cases for the selected countries. Hover-tool on.
-
-from datetime import datetime
-from bokeh.io import output_file, show
-from bokeh.models import HoverTool, ColumnDataSource
+from bokeh.io import output_file, save
+from bokeh.layouts import column
+from bokeh.models import HoverTool, ColumnDataSource, CDSView, GroupFilter, LegendItem
 from bokeh.transform import factor_cmap, factor_mark
-from bokeh.plotting import figure, output_file, show
-
-source = ColumnDataSource(covid)
-source.add(covid['date'].apply(lambda d: d.strftime('%Y-%m-%d')), 'date_formatted')
-
-COUNTRIES = ['DNK', 'ESP', 'ITA', 'SWE', 'USA']
-MARKERS = ['hex', 'circle_x', 'triangle', 'square', 'circle']
-
-p = figure(title='Total Number of Confirmed COVID-19 Cases', x_axis_type='datetime', 
-           x_axis_label='Date', y_axis_label='Log Cases', y_axis_type="log", plot_height=400, plot_width=700,
-           tools=[HoverTool(tooltips=[('Country','@country'),('Confirmed Cases','@total_cases' ), ('Date','@date_formatted')])])
-
-p.scatter("date", "total_cases", source=source, fill_alpha=0.4, size=6,
-          marker=factor_mark('country', MARKERS, COUNTRIES),
-          color=factor_cmap('country', 'Category10_5', COUNTRIES))
-
-output_file("COVID19_1.html", title="Total Number of Confirmed COVID-19 Cases")
-
-show(p)
-
-
-# %%
-#Plotting log-scale number of cases for the selected countries. Hover-tool and series-hiding on.
-
-from bokeh.plotting import figure, show, output_file
-from bokeh.models import ColumnDataSource, CDSView, GroupFilter, HoverTool
-
-source = ColumnDataSource(covid)
-source.add(covid['date'].apply(lambda d: d.strftime('%Y-%m-%d')), 'date_formatted')
-
-USA = CDSView(source=source, filters=[GroupFilter(column_name='country', group='USA')])
-DNK = CDSView(source=source, filters=[GroupFilter(column_name='country', group='DNK')])
-SWE = CDSView(source=source, filters=[GroupFilter(column_name='country', group='SWE')])
-ITA = CDSView(source=source, filters=[GroupFilter(column_name='country', group='ITA')])
-ESP = CDSView(source=source, filters=[GroupFilter(column_name='country', group='ESP')])
-
-p = figure(title='Total Confirmed COVID-19 Cases (Click on legend entries to hide the corresponding datapoints)', x_axis_type='datetime', 
-           x_axis_label='Date', y_axis_label='Log Cases', y_axis_type="log", plot_height=400, plot_width=700,
-           tools=[HoverTool(tooltips=[('Country','@country'),('Confirmed Cases','@total_cases' ), ('Date','@date_formatted')])])
-
-p.circle(x='date', y='total_cases', source=source, view=USA,
-         size=6, color='red', alpha=0.4, legend='USA')
-p.square(x='date', y='total_cases', source=source, view=DNK,
-         size=6, color='green', alpha=0.4, legend='DNK')
-p.triangle(x='date', y='total_cases', source=source, view=SWE,
-         size=6, color='purple', alpha=0.4, legend='SWE')
-p.circle_x(x='date', y='total_cases', source=source, view=ITA,
-         size=6, color='black', alpha=0.4, legend='ITA')
-p.hex(x='date', y='total_cases', source=source, view=ESP,
-         size=6, color='blue', alpha=0.4, legend='ESP')
-
-p.legend.location = "top_left"
-p.legend.click_policy="hide"
-output_file("COVID19_2.html", title="Total Confirmed COVID-19 Cases (Click on legend entries to hide the corresponding datapoints")
-show(p)
-
-# %% [markdown]
-# **Deaths**
-
-# %%
-#Plotting log-scale number of cases for the selected countries. Hover-tool on.
+from bokeh.plotting import figure
+register_matplotlib_converters()
 
-from bokeh.io import output_file, show
-from bokeh.models import HoverTool, ColumnDataSource
-from bokeh.transform import factor_cmap, factor_mark
-from bokeh.plotting import figure, output_file, show
+#Folder of this file, where the bundled workbooks are.
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
 
-source = ColumnDataSource(covid)
-source.add(covid['date'].apply(lambda d: d.strftime('%Y-%m-%d')), 'date_formatted')
+#The profiling of the stages is shared with modelproject.py, see instrumentation.py in the folder above.
+sys.path.insert(0, os.path.dirname(DATA_DIR))
+import instrumentation
+from instrumentation import profiling, profiling_from_env, stage, stage_report
 
+#The 5 countries analyzed, their markers in the charts, and the months of interest (March & April).
 COUNTRIES = ['DNK', 'ESP', 'ITA', 'SWE', 'USA']
 MARKERS = ['hex', 'circle_x', 'triangle', 'square', 'circle']
-
-p = figure(title='Total Number of COVID-19 Deaths', x_axis_type='datetime', 
-           x_axis_label='Date', y_axis_label='Log Deaths', y_axis_type="log", plot_height=400, plot_width=700,
-           tools=[HoverTool(tooltips=[('Country','@country'),('Deaths','@total_deaths' ), ('Date','@date_formatted')])])
-
-p.scatter("date", "total_deaths", source=source, fill_alpha=0.3, size=6,
-          marker=factor_mark('country', MARKERS, COUNTRIES),
-          color=factor_cmap('country', 'Category10_5', COUNTRIES))
-
-output_file("COVID19_3.html", title="Total Number of COVID-19 Deaths")
-
-show(p)
-
-
-# %%
-#Plotting log-scale number of cases for the selected countries. Hover-tool and series-hiding on.
-
-from datetime import datetime
-from bokeh.io import output_file, show
-from bokeh.models import HoverTool, ColumnDataSource
-from bokeh.transform import factor_cmap, factor_mark
-from bokeh.plotting import figure, output_file, show
-
-source = ColumnDataSource(covid)
-source.add(covid['date'].apply(lambda d: d.strftime('%Y-%m-%d')), 'date_formatted')
-
-USA = CDSView(source=source, filters=[GroupFilter(column_name='country', group='USA')])
-DNK = CDSView(source=source, filters=[GroupFilter(column_name='country', group='DNK')])
-SWE = CDSView(source=source, filters=[GroupFilter(column_name='country', group='SWE')])
-ITA = CDSView(source=source, filters=[GroupFilter(column_name='country', group='ITA')])
-ESP = CDSView(source=source, filters=[GroupFilter(column_name='country', group='ESP')])
-
-p = figure(title='Total Number of COVID-19 Deaths (Click on legend entries to hide the corresponding datapoints)', x_axis_type='datetime', 
-           x_axis_label='Date', y_axis_label='Log Deaths', y_axis_type="log", plot_height=400, plot_width=700, 
-           tools=[HoverTool(tooltips=[('Country','@country'),('Deaths','@total_deaths' ), ('Date','@date_formatted')])])
-
-p.circle(x='date', y='total_deaths', source=source, view=USA,
-         size=6, color='red', alpha=0.4, legend='USA')
-p.square(x='date', y='total_deaths', source=source, view=DNK,
-         size=6, color='green', alpha=0.4, legend='DNK')
-p.triangle(x='date', y='total_deaths', source=source, view=SWE,
-         size=6, color='purple', alpha=0.4, legend='SWE')
-p.circle_x(x='date', y='total_deaths', source=source, view=ITA,
-         size=6, color='black', alpha=0.4, legend='ITA')
-p.hex(x='date', y='total_deaths', source=source, view=ESP,
-         size=6, color='blue', alpha=0.4, legend='ESP')
-
-p.legend.location = "top_left"
-p.legend.click_policy="hide"
-output_file("COVID19_4.html", title="Total Number of COVID-19 Deaths (Click on legend entries to hide the corresponding datapoints")
-show(p)
-
-# %% [markdown]
-# The above plots confirm some of the points made from Figures 1-5.
-# 
-# When comparing the two selected Scandinavian countries, Denmark and Sweden, it is clear that the outbreak is more severe in Sweden. This is particularly evident when comparing the number of total deaths - the flattening of the curve appears more significantly and earlier.
-# 
-# The growth in both number of cases and deaths in Italy and Spain appears critical at its peak, and as noted slightly delayed in Spain - both countries' curves seem to be flattening out to some extent.
-# 
-# The numbers and plots for the United States tell their own story - there is little evidence of the outbreak slowing.
-# %% [markdown]
-# **COVID-19 and the stock market**
-# 
-# The pandemic has had a significant effect on the global economy and as such the stock market. Due to availability of daily data we wish to consider the S&P 500 index and the development of COVID-19 in the United States.
-# 
-# **Reading the relevant data** for the S&P500 stock index in the period considered (March and April 2020). 
-
-# %%
-SP500 = pd.read_excel('SP500.xls')
-SP500['country']='USA'
-SP500.head()
-
-# %% [markdown]
-# **Merging** the data with COVID-19 data in the United States. As such, we merge by data and country in the original 'covid' dataset.
-
-# %%
-covid_stocks = pd.merge(covid, SP500, how='inner',on=['date', 'country'])
-covid_stocks.head()
-
-# %% [markdown]
-# **Plotting the data**
-# 
-# Note: The following 4 graphs are plotted using bokeh plot tools. As such, every plot will appear in a new browser-tab.
-# 
-# We plot the data for the S&P500 stock market below such as to get a general idea of the development in the index.
-
-# %%
-#Plotting log-scale number of cases for the selected countries. Hover-tool and series-hiding on.
-
-from datetime import datetime
-from bokeh.io import output_file, show
-from bokeh.models import HoverTool, ColumnDataSource
-from bokeh.transform import factor_cmap, factor_mark
-from bokeh.plotting import figure, output_file, show
-
-source1 = ColumnDataSource(covid_stocks)
-source1.add(covid_stocks['date'].apply(lambda d: d.strftime('%Y-%m-%d')), 'date_formatted')
-
-p = figure(title='SP500', x_axis_type='datetime', 
-           x_axis_label='Date', y_axis_label='SP500', plot_height=400, plot_width=700, 
-           tools=[HoverTool(tooltips=[('SP500','@SP500' ), ('Date','@date_formatted')])])
-
-p.circle(x='date', y='SP500', source=source1,
-         size=8, color='red', alpha=0.4)
-
-output_file("COVID19_5.html", title="SP500")
-show(p)
-
-# %% [markdown]
-# We observe a sharp downturn in the index in early March as the pandemic critically reaches the United States. Throughout the rest of March and April a degree of recovery is observed.
-
-# %%
-#Plotting log-scale number of cases for the selected countries. Hover-tool and series-hiding on.
-
-from datetime import datetime
-from bokeh.io import output_file, show
-from bokeh.models import HoverTool, ColumnDataSource
-from bokeh.transform import factor_cmap, factor_mark
-from bokeh.plotting import figure, output_file, show
-
-source1 = ColumnDataSource(covid_stocks)
-source1.add(covid_stocks['date'].apply(lambda d: d.strftime('%Y-%m-%d')), 'date_formatted')
-
-p = figure(title='SP500', x_axis_label='Daily Confirmed Cases of Covid-19', y_axis_label='SP500', plot_height=400, plot_width=700, 
-           tools=[HoverTool(tooltips=[('SP500','@SP500' ), ('Date','@date_formatted'), ('Cases','@cases' ), ('Deaths','@deaths' )])])
-
-p.circle(x='cases', y='SP500', source=source1,
-         size=8, color='blue', alpha=0.4)
-
-output_file("COVID19_6.html", title="Scatter SP500 COVID-Cases")
-show(p)
-
-# %% [markdown]
-# With the daily number of recorded cases below approx. 10.000, a clear negative correlation between number of confirmed cases and the S&P500 can be observed. As we noted in the first graph, the S&P500 recovers to some extent in late March - this coincides with extremely large numbers of daily recorded cases, which is why a seemingly positive correlation between cases and the S&P500 index can be seen - this correlation can not be interpreted as the isolated effect of COVID-19 cases in the United States on the S&P500 index. The later increase in the stock markted could be due to several macro and socioeconomic factors.
-
+START, END = '2020-03-01', '2020-04-30'
+
+#Columns kept from the ECDC data, renamed when read: countryterritoryCode -> country, dateRep -> date.
+KEEP_COLUMNS = ['date', 'day', 'month', 'cases', 'deaths', 'country', 'popData2018']
+
+
+### Instrumentation
+#
+# Stages of the analysis are timed when profiling is switched on, with profiling(True) or the
+# environment variable DATAPROJECT_PROFILE=1, see instrumentation.py in the folder above.
+
+#Number of rows of a result, None if it has no rows.
+def _rows(obj):
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    return len(obj) if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray, list)) else None
+
+#Decorator recording each call of a function as a stage, with the rows of the first argument and of the result.
+def staged(name):
+    return instrumentation.staged(name, lambda args, kwargs: _rows(args[0]) if args else None, _rows)
+
+#Profiling is switched on by the environment variable.
+profiling_from_env('DATAPROJECT_PROFILE')
+
+
+### Read and clean data
+#
+# Parsing the Excel workbooks is slow. The data is therefore read once and stored in a columnar
+# cache (Parquet) with typed columns, which is renewed when the source file changes.
+
+#Folder for the columnar cache of the data.
+CACHE_DIR = os.environ.get('DATAPROJECT_CACHE', '.cache')
+
+#Metadata identifying the version of a source (file or URL).
+def source_version(source, previous=None):
+    """ version of a source
+    
+    Args:
+    
+        source (str): path or URL
+        previous (dict): version stored with the cache, used to skip hashing files with unchanged modification time
+        
+    Returns:
+    
+        version (dict): for files the modification time, size and sha256 hash, for URLs the URL
+    
+    """
+    
+    if not os.path.exists(source):
+        return {'source': source}
+    
+    stat = os.stat(source)
+    version = {'source': os.path.abspath(source), 'mtime': stat.st_mtime, 'size': stat.st_size}
+    if previous is not None and all(previous.get(k) == v for k, v in version.items()):
+        version['sha256'] = previous.get('sha256')
+        return version
+    
+    h = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    version['sha256'] = h.hexdigest()
+    return version
+
+#Read a source through the cache.
+def cached_read(name, source, read, cache_dir=CACHE_DIR, refresh=False):
+    """ read a source once and keep it in a columnar cache
+    
+    Args:
+    
+        name (str): name of the cached dataset
+        source (str): path or URL
+        read (callable): read(source) returns a typed DataFrame
+        cache_dir (str): cache folder
+        refresh (bool): read the source even if the cache is valid
+        
+    Returns:
+    
+        path (str): path of the cached data
+    
+    """
+    
+    path = os.path.join(cache_dir, f'{name}.parquet')
+    meta_path = os.path.join(cache_dir, f'{name}.json')
+    
+    # a. is the cache valid?
+    previous = None
+    if os.path.exists(meta_path) and os.path.exists(path):
+        with open(meta_path) as f:
+            previous = json.load(f)
+    version = source_version(source, previous)
+    
+    if refresh or previous is None or any(previous.get(k) != version.get(k) for k in ['source', 'sha256']):
+        
+        # b. read and store
+        os.makedirs(cache_dir, exist_ok=True)
+        read(source).to_parquet(path, index=False)
+    
+    elif previous == version:
+        return path
+    
+    # c. store the version
+    with open(meta_path, 'w') as f:
+        json.dump(version, f)
+    
+    return path
+
+#Read the ECDC workbook with typed columns.
+def read_covid(source):
+    covid = pd.read_excel(source)
+    covid.rename(columns = {'countryterritoryCode':'country', 'dateRep':'date'}, inplace=True)
+    return covid.astype({'date':'datetime64[ns]', 'day':'int8', 'month':'int8', 'year':'int16',
+                         'cases':'int32', 'deaths':'int32',
+                         'country':'category', 'countriesAndTerritories':'category', 'geoId':'category'})
+
+#Read the S&P 500 workbook with typed columns.
+def read_sp500(source):
+    SP500 = pd.read_excel(source)
+    SP500['country'] = 'USA'
+    return SP500.astype({'date':'datetime64[ns]', 'SP500':'float64', 'country':'category'})
+
+#Read a table exported from Statistics Denmark (StatBank) to long format.
+def read_statbank(source):
+    """ read a StatBank workbook
+    
+    The workbook has the title in the first row, the units in the second, the years in the
+    third and then one row per combination of the variables, where a label is only given when it changes.
+    
+    Args:
+    
+        source (str): path or URL
+        
+    Returns:
+    
+        data (DataFrame): one row per combination of the variables and year, with a categorical
+            column per variable (named from the title), year and value
+    
+    """
+    
+    raw = pd.read_excel(source, header=None)
+    title = raw.iloc[0, 0]
+    years = pd.to_numeric(raw.iloc[2], errors='coerce')
+    n_labels = int(years.notna().to_numpy().argmax())
+    
+    # a. names of the variables from the title, e.g. "... by type of income, sex, unit, region and time"
+    names = title.split(' by ')[-1].replace(' and ', ', ').split(', ')
+    names = [name.strip().lower().replace(' ', '_') for name in names if name.strip() != 'time']
+    if len(names) != n_labels:
+        names = [f'label_{i}' for i in range(n_labels)]
+    
+    # b. long format
+    body = raw.iloc[3:].dropna(how='all')
+    labels = body.iloc[:, :n_labels].ffill()
+    labels.columns = names
+    values = body.iloc[:, n_labels:].to_numpy(dtype=float)
+    data = labels.loc[labels.index.repeat(values.shape[1])].reset_index(drop=True)
+    data['year'] = np.tile(years.iloc[n_labels:].to_numpy(), len(body)).astype('int16')
+    data['value'] = values.ravel()
+    return data.astype({name: 'category' for name in names})
+
+#Bundled datasets, their source and how they are read.
+DATASETS = {'covid': {'source': 'Covid_Data.xlsx', 'read': read_covid},
+            'sp500': {'source': 'SP500.xls', 'read': read_sp500},
+            'income': {'source': 'INDKP101.xlsx', 'read': read_statbank},
+            'employment': {'source': 'RAS200.xlsx', 'read': read_statbank}}
+
+#Load a dataset from the cache, reading the source if the cache is missing or out of date.
+@staged('load')
+def load(name, columns=None, filters=None, source=None, cache_dir=CACHE_DIR, refresh=False):
+    """ load a dataset
+    
+    Only the requested columns and rows are read from the cache.
+    
+    Args:
+    
+        name (str): name of the dataset in DATASETS
+        columns (list): columns to read, None reads all
+        filters (list): row filters as (column, op, value) tuples, e.g. ('region', '==', 'All Denmark')
+        source (str): path or URL, default is the source in DATASETS in DATA_DIR
+        cache_dir (str): cache folder
+        refresh (bool): read the source even if the cache is valid
+        
+    Returns:
+    
+        data (DataFrame): the data
+    
+    """
+    
+    dataset = DATASETS[name]
+    source = source or os.path.join(DATA_DIR, dataset['source'])
+    path = cached_read(name, source, dataset['read'], cache_dir=cache_dir, refresh=refresh)
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+#Load the COVID-19 data with a selection of countries and dates.
+def load_covid(source=None, cache_dir=CACHE_DIR, refresh=False,
+               countries=None, start=None, end=None, columns=None):
+    """ load the COVID-19 data
+    
+    The selection of countries, dates and columns is applied when reading the cache,
+    such that only the selected data is read into memory.
+    
+    Args:
+    
+        source (str): path or URL of the ECDC workbook, default is Covid_Data.xlsx in DATA_DIR
+        cache_dir (str): cache folder
+        refresh (bool): read the source even if the cache is valid
+        countries (list): country codes to keep, None keeps all
+        start (str or Timestamp): first date to keep, None keeps from the first date
+        end (str or Timestamp): last date to keep, None keeps until the last date
+        columns (list): columns to keep, None keeps all
+        
+    Returns:
+    
+        covid (DataFrame): selected data sorted by date and country
+    
+    """
+    
+    filters = []
+    if countries is not None:
+        filters.append(('country', 'in', list(countries)))
+    if start is not None:
+        filters.append(('date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('date', '<=', pd.Timestamp(end)))
+    
+    covid = load('covid', columns=columns, filters=filters, source=source, cache_dir=cache_dir, refresh=refresh)
+    if 'country' in covid:
+        covid['country'] = covid['country'].cat.remove_unused_categories()
+    sort_by = [c for c in ['date', 'country'] if c in covid]
+    if sort_by:
+        covid.sort_values(sort_by, inplace=True, ignore_index=True)
+    return covid
+
+
+### Reformat the data
+
+#Wide format with one column per country and variable, "<ISO> cases" and "<ISO> deaths", and one row per date.
+@staged('reshape')
+def wide_format(covid, values=('cases', 'deaths'), cumulative=True):
+    """ reformat the data to wide format with one pivot
+    
+    Args:
+    
+        covid (DataFrame): data with columns date, country and values
+        values (tuple): variables to reformat
+        cumulative (bool): accumulate the variables over dates
+        
+    Returns:
+    
+        wide (DataFrame): date-sorted frame with columns "<country> <value>", ordered by country
+    
+    """
+    
+    values = list(values)
+    wide = covid.pivot(index='date', columns='country', values=values).sort_index()
+    countries = sorted(covid['country'].unique())
+    wide = wide[[(value, country) for country in countries for value in values]]
+    wide.columns = [f'{country} {value}' for value, country in wide.columns]
+    if cumulative:
+        wide = wide.cumsum()
+    return wide
+
+#Total cases and deaths by country, the data must be sorted by date.
+@staged('cumulative')
+def add_totals(covid, start=None):
+    """ add cumulative cases and deaths by country
+    
+    Args:
+    
+        covid (DataFrame): data sorted by date with columns country, cases and deaths
+        start (DataFrame): summary of earlier data to continue from, see partial_summary()
+        
+    Returns:
+    
+        covid (DataFrame): the data with columns total_cases and total_deaths
+    
+    """
+    
+    totals = covid.groupby('country', observed=True)[['cases', 'deaths']].cumsum()
+    covid['total_cases'] = totals['cases']
+    covid['total_deaths'] = totals['deaths']
+    if start is not None:
+        for var in ['cases', 'deaths']:
+            offset = covid['country'].astype(str).map(start[f'{var}_sum']).fillna(0)
+            covid[f'total_{var}'] += offset.to_numpy().astype(covid[f'total_{var}'].dtype)
+    return covid
+
+
+### Summary statistics
+#
+# The summary statistics by country are computed in one grouped pass. The pass produces partial
+# aggregates (counts, sums, maximums, peak dates and the maximum of the running totals), which can be merged.
+
+#Variables summarized by country.
+SUMMARY_VARS = ['cases', 'deaths']
+
+#Partial aggregates by country of a chunk of data.
+def partial_summary(chunk):
+    """ mergeable aggregates by country
+    
+    Args:
+    
+        chunk (DataFrame): data sorted by date with columns date, country, cases, deaths and optionally popData2018
+        
+    Returns:
+    
+        part (DataFrame): by country, first and last date, number of days and for each variable the
+            sum, maximum, date of the maximum and maximum of the running total within the chunk
+    
+    """
+    
+    frame = pd.DataFrame({'country': chunk['country'].astype(str).to_numpy(), 'date': chunk['date'].to_numpy()})
+    for var in SUMMARY_VARS:
+        frame[var] = chunk[var].to_numpy()
+    if 'popData2018' in chunk:
+        frame['population'] = chunk['popData2018'].to_numpy()
+    
+    grouped = frame.groupby('country')
+    running = grouped[SUMMARY_VARS].cumsum()
+    aggs = {'first_date': ('date', 'min'), 'last_date': ('date', 'max'), 'n': ('date', 'size')}
+    for var in SUMMARY_VARS:
+        frame[f'{var}_running'] = running[var]
+        aggs.update({f'{var}_sum': (var, 'sum'), f'{var}_max': (var, 'max'), f'{var}_peak': (var, 'idxmax'),
+                     f'total_{var}_max': (f'{var}_running', 'max')})
+    if 'population' in frame:
+        aggs['population'] = ('population', 'last')
+    
+    part = frame.groupby('country').agg(**aggs)
+    for var in SUMMARY_VARS:
+        part[f'{var}_peak'] = frame['date'].to_numpy()[part[f'{var}_peak'].to_numpy()]
+    return part.astype({col: 'int64' for col in part.columns if col == 'n' or col.endswith(('_sum', '_max'))})
+
+#Merge partial aggregates of an earlier chunk, a, and a later chunk, b.
+def merge_summaries(a, b):
+    if a is None:
+        return b
+    
+    index = a.index.union(b.index)
+    a, b = a.reindex(index), b.reindex(index)
+    merged = pd.DataFrame(index=index)
+    merged['first_date'] = a['first_date'].fillna(b['first_date'])
+    merged['last_date'] = b['last_date'].fillna(a['last_date'])
+    merged['n'] = a['n'].add(b['n'], fill_value=0)
+    for var in SUMMARY_VARS:
+        later = (b[f'{var}_max'] > a[f'{var}_max']) | a[f'{var}_max'].isna()
+        merged[f'{var}_sum'] = a[f'{var}_sum'].add(b[f'{var}_sum'], fill_value=0)
+        merged[f'{var}_max'] = b[f'{var}_max'].where(later, a[f'{var}_max'])
+        merged[f'{var}_peak'] = b[f'{var}_peak'].where(later, a[f'{var}_peak'])
+        merged[f'total_{var}_max'] = np.fmax(a[f'total_{var}_max'], a[f'{var}_sum'].fillna(0) + b[f'total_{var}_max'])
+    if 'population' in a or 'population' in b:
+        merged['population'] = b.get('population', pd.Series(np.nan, index)).fillna(a.get('population', pd.Series(np.nan, index)))
+    return merged.astype({col: 'int64' for col in merged.columns if col == 'n' or col.endswith(('_sum', '_max'))})
+
+#Summary statistics by country of a frame or of an iterable of date-ordered chunks.
+@staged('aggregate')
+def covid_summary(data, per_capita=False):
+    """ summary statistics by country
+    
+    Args:
+    
+        data (DataFrame or iterable): data, or chunks of data in date order, see partial_summary()
+        per_capita (bool): add totals per 100.000 inhabitants, requires the column popData2018
+        
+    Returns:
+    
+        summary (DataFrame): by country, mean and maximum of daily cases and deaths, dates of the maximums and totals
+    
+    """
+    
+    if isinstance(data, pd.DataFrame):
+        part = partial_summary(data)
+    else:
+        part = None
+        for chunk in data:
+            part = merge_summaries(part, partial_summary(chunk))
+    return summary_from_partial(part, per_capita)
+
+#Summary statistics by country from partial aggregates, e.g. the state of a store, without the rows.
+def summary_from_partial(part, per_capita=False):
+    """ summary statistics by country from partial aggregates
+    
+    Args:
+    
+        part (DataFrame): partial aggregates, see partial_summary(), merge_summaries() and append_covid()
+        per_capita (bool): add totals per 100.000 inhabitants, requires the column population
+        
+    Returns:
+    
+        summary (DataFrame): by country, mean and maximum of daily cases and deaths, dates of the maximums and totals
+    
+    """
+    
+    summary = pd.DataFrame(index=part.index)
+    for var in SUMMARY_VARS:
+        summary[var] = part[f'{var}_sum']/part['n']
+    summary.columns = [f'{var}_mean' for var in SUMMARY_VARS]
+    for var in SUMMARY_VARS:
+        summary[f'{var}_max'] = part[f'{var}_max']
+        summary[f'{var}_peak'] = part[f'{var}_peak']
+    for var in SUMMARY_VARS:
+        summary[f'total_{var}'] = part[f'total_{var}_max']
+    if per_capita:
+        for var in SUMMARY_VARS:
+            summary[f'total_{var}_per_100k'] = summary[f'total_{var}']/part['population']*1e5
+    return summary
+
+
+### Daily updates
+#
+# New rows are stored next to the existing data, and the totals and summary statistics are continued
+# from the partial aggregates of the stored data.
+
+#Append new daily rows to a store folder with one Parquet file per update.
+def append_covid(folder, new):
+    """ append new rows to a store and continue totals and state
+    
+    Args:
+    
+        folder (str): store folder, created if missing
+        new (DataFrame): new rows with columns date, country, cases and deaths
+        
+    Returns:
+    
+        new (DataFrame): the appended rows with columns total_cases and total_deaths
+        state (DataFrame): partial aggregates of all stored data, see partial_summary()
+    
+    """
+    
+    os.makedirs(folder, exist_ok=True)
+    state_path = os.path.join(folder, 'state.parquet')
+    state = pd.read_parquet(state_path) if os.path.exists(state_path) else None
+    
+    # a. new rows, skipping dates already stored
+    new = new.sort_values(['date', 'country'], ignore_index=True)
+    new['country'] = new['country'].astype(str)
+    if state is not None:
+        new = new.loc[new['date'] > new['country'].map(state['last_date'])
+                      .fillna(pd.Timestamp.min).astype(new['date'].dtype)].reset_index(drop=True)
+    if new.empty:
+        return new, state
+    
+    # b. totals continued from the state
+    new = add_totals(new, start=state)
+    
+    # c. store
+    part = len([f for f in os.listdir(folder) if f.startswith('part-')])
+    new.to_parquet(os.path.join(folder, f'part-{part:05d}.parquet'), index=False)
+    
+    # d. update the state
+    state = merge_summaries(state, partial_summary(new))
+    state.to_parquet(state_path)
+    return new, state
+
+#Read all rows of a store folder.
+def read_store(folder):
+    parts = sorted(f for f in os.listdir(folder) if f.startswith('part-'))
+    covid = pd.concat([pd.read_parquet(os.path.join(folder, f)) for f in parts], ignore_index=True)
+    covid['country'] = covid['country'].astype('category')
+    return covid.sort_values(['date', 'country'], ignore_index=True)
+
+#Check that the stored totals and state equal a full recomputation.
+def check_store(folder):
+    stored = read_store(folder)
+    full = add_totals(stored.drop(columns=['total_cases', 'total_deaths']))
+    pd.testing.assert_frame_equal(stored, full)
+    state = pd.read_parquet(os.path.join(folder, 'state.parquet'))
+    pd.testing.assert_frame_equal(state, partial_summary(full), check_index_type=False)
+    return True
+
+
+### Figures of total cases and deaths
+
+#Names of the countries used in figure titles, other countries are shown by their code.
+COUNTRY_NAMES = {'DNK': 'Denmark', 'SWE': 'Sweden', 'ITA': 'Italy', 'ESP': 'Spain', 'USA': 'the United States'}
+
+#Draw the twin-axis plot of total cases (left axis) and total deaths (right axis) for one country.
+def plot_country(ax, covid_ref, country, title):
+    
+    color = 'tab:red'
+    line_cases, = ax.plot(covid_ref[country + ' cases'], color=color, label='Total Cases')
+    ax.set_ylabel('Total Cases')
+    ax.set_xlabel('Date')
+    ax.legend(loc='upper left')
+    
+    ax2 = ax.twinx()
+    
+    color = 'tab:blue'
+    ax2.set_ylabel('Total Deaths')
+    line_deaths, = ax2.plot(covid_ref[country + ' deaths'], color=color, label='Total Deaths')
+    ax2.set_xlabel('Date')
+    ax2.grid(True)
+    ax2.legend(loc='upper center')
+    ax.set_title(title)
+    
+    return line_cases, line_deaths
+
+#Small multiples of total cases and deaths, one panel per country.
+def country_figure(covid_ref, countries, ncols=1, panel_size=(10,8), fig=None, first=1):
+    """ figure with one twin-axis panel per country
+    
+    Args:
+    
+        covid_ref (DataFrame): wide format data, see wide_format()
+        countries (list): country codes
+        ncols (int): number of columns of panels
+        panel_size (tuple): width and height of each panel in inches
+        fig (Figure): figure to draw in, default is a new pyplot figure
+        first (int): number of the first figure in the titles
+        
+    Returns:
+    
+        fig (Figure): the figure
+        artists (dict): the lines of cases and deaths for each country, see update_country_figure()
+    
+    """
+    
+    nrows = -(-len(countries)//ncols)
+    if fig is None:
+        fig = plt.figure(figsize=(panel_size[0]*ncols, panel_size[1]*nrows))
+    
+    artists = {}
+    for i, country in enumerate(countries):
+        ax = fig.add_subplot(nrows, ncols, i+1)
+        title = f'Figure {first+i}: COVID-19 Related Cases and Deaths in {COUNTRY_NAMES.get(country, country)}'
+        artists[country] = plot_country(ax, covid_ref, country, title)
+    
+    return fig, artists
+
+#Redraw a figure from country_figure() with new data, reusing the axes and lines.
+def update_country_figure(fig, artists, covid_ref):
+    for country, lines in artists.items():
+        for line, var in zip(lines, ['cases', 'deaths']):
+            line.set_data(covid_ref.index, covid_ref[f'{country} {var}'])
+            line.axes.relim()
+            line.axes.autoscale_view()
+    fig.canvas.draw_idle()
+    return fig
+
+#Render one country to a file without pyplot, used by render_countries().
+def _render_country(covid_ref, country, path, panel_size=(10,8)):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=panel_size)
+    country_figure(covid_ref, [country], panel_size=panel_size, fig=fig,
+                   first=1 + list(COUNTRY_NAMES).index(country) if country in COUNTRY_NAMES else 1)
+    fig.savefig(path, bbox_inches='tight')
+    return path
+
+#Render one file per country in parallel processes.
+def render_countries(covid_ref, countries, folder, fmt='png', panel_size=(10,8), workers=None):
+    """ render each country to a separate file
+    
+    Args:
+    
+        covid_ref (DataFrame): wide format data, see wide_format()
+        countries (list): country codes
+        folder (str): output folder
+        fmt (str): file format, e.g. 'png' or 'svg'
+        panel_size (tuple): width and height of each figure in inches
+        workers (int): number of processes, default is all cores, 1 renders in this process
+        
+    Returns:
+    
+        paths (list): paths of the rendered files
+    
+    """
+    
+    os.makedirs(folder, exist_ok=True)
+    jobs = [(covid_ref[[f'{country} cases', f'{country} deaths']], country,
+             os.path.join(folder, f'{country}.{fmt}'), panel_size) for country in countries]
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 1 or len(jobs) <= 1:
+        return [_render_country(*job) for job in jobs]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        return list(executor.map(_render_country, *zip(*jobs)))
+
+
+### Growth rates and doubling times
+#
+# Under exponential growth the slope of a log-linear fit of the totals is constant,
+# and the doubling time is ln(2) divided by the slope.
+
+#Rolling means of a (dates x countries) array over windows of rows, NaN for the first window-1 rows (all rows if fewer).
+def rolling_mean(values, window):
+    out = np.full(values.shape, np.nan)
+    if values.shape[0] < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+    out[window-1:] = windows.mean(axis=-1)
+    return out
+
+#Rolling slopes of log-linear fits of a (dates x countries) array of totals, NaN where a total is not positive.
+def rolling_log_slope(totals, window):
+    out = np.full(totals.shape, np.nan)
+    if totals.shape[0] < window:
+        return out
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.where(totals > 0, np.log(totals), np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(logs, window, axis=0)
+    t = np.arange(window) - (window-1)/2
+    out[window-1:] = (windows - windows.mean(axis=-1, keepdims=True)) @ t / (t @ t)
+    return out
+
+#Growth analytics of all countries at once.
+@staged('cumulative')
+def add_growth(covid, window=7):
+    """ add growth rates, rolling averages and doubling times by country
+    
+    Args:
+    
+        covid (DataFrame): data with columns date, country, cases and deaths
+        window (int): days in the rolling windows
+        
+    Returns:
+    
+        covid (DataFrame): the data with for var in cases and deaths the columns var_avg (rolling average),
+            total_var_growth (daily growth rate), total_var_slope (rolling log-linear slope) and
+            total_var_doubling (doubling time in days, NaN if the total is not growing)
+    
+    """
+    
+    daily = wide_format(covid, cumulative=False)
+    dates = daily.index.get_indexer(covid['date'])
+    countries = sorted(covid['country'].unique())
+    
+    for var in ['cases', 'deaths']:
+        values = daily[[f'{country} {var}' for country in countries]].to_numpy(dtype=float)
+        totals = np.nancumsum(values, axis=0)
+        
+        previous = np.full(totals.shape, np.nan)
+        previous[1:] = totals[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(previous > 0, totals/previous - 1, np.nan)
+        slope = rolling_log_slope(totals, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            doubling = np.where(slope > 0, np.log(2)/slope, np.nan)
+        
+        pos = (dates, pd.Index(countries).get_indexer(covid['country']))
+        covid[f'{var}_avg'] = rolling_mean(values, window)[pos]
+        covid[f'total_{var}_growth'] = growth[pos]
+        covid[f'total_{var}_slope'] = slope[pos]
+        covid[f'total_{var}_doubling'] = doubling[pos]
+    
+    return covid
+
+
+### Interactive charts
+
+#Data source shared by the charts, with the date formatted for the hover tool.
+def covid_source(data, columns=None):
+    """ ColumnDataSource of the data
+    
+    Args:
+    
+        data (DataFrame): data with a date column
+        columns (list): columns to include, None includes all
+        
+    Returns:
+    
+        source (ColumnDataSource): source with the columns and date_formatted
+    
+    """
+    
+    columns = list(data.columns) if columns is None else columns
+    source_data = {}
+    for col in columns:
+        values = data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(str)
+        source_data[col] = values.to_numpy()
+    source_data['date_formatted'] = data['date'].dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+    return ColumnDataSource(source_data)
+
+#Save charts in one document, such that data sources shared by the charts are only included once.
+def dashboard(figures, filename, title):
+    output_file(filename, title=title)
+    return save(column(*figures))
+
+#Indices of n_out points keeping the visual shape of y(x), largest-triangle-three-buckets.
+def lttb(x, y, n_out):
+    """ largest-triangle-three-buckets downsampling
+    
+    The first and last point are kept. The points in between are split in n_out-2 buckets and from
+    each bucket the point forming the largest triangle with the point kept from the previous bucket
+    and the average of the next bucket is kept.
+    
+    Args:
+    
+        x (ndarray): increasing x values
+        y (ndarray): y values
+        n_out (int): number of points to keep
+        
+    Returns:
+    
+        idx (ndarray): increasing indices of the kept points
+    
+    """
+    
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = x.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    edges = np.linspace(1, n-1, n_out-1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n-1
+    a = 0
+    for i in range(n_out-2):
+        start, stop = edges[i], edges[i+1]
+        if i+2 < edges.size:
+            avg_x, avg_y = x[stop:edges[i+2]].mean(), y[stop:edges[i+2]].mean()
+        else:
+            avg_x, avg_y = x[n-1], y[n-1]
+        area = np.abs((x[a]-avg_x)*(y[start:stop]-y[a]) - (x[a]-x[start:stop])*(avg_y-y[a]))
+        a = start + int(np.argmax(area))
+        idx[i+1] = a
+    return idx
+
+#Indices of the minimum and maximum of y in each of n_buckets buckets of equal width in x.
+def minmax_buckets(x, y, n_buckets):
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if 2*n_buckets >= x.size:
+        return np.arange(x.size)
+    bucket = np.minimum(((x - x[0])/(x[-1] - x[0] or 1)*n_buckets).astype(int), n_buckets-1)
+    order = np.lexsort((y, bucket))
+    first = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    last = np.r_[first[1:] - 1, order.size - 1]
+    return np.unique(order[np.r_[first, last]])
+
+#Downsample each country's time series of a variable.
+def downsample(data, metric, n_points, method='lttb', log=True, x_range=None):
+    """ downsample the time series of each country
+    
+    Args:
+    
+        data (DataFrame): data with columns date, country and metric
+        metric (str): variable shaping the downsampling
+        n_points (int): points per country, for method 'minmax' two points per bucket of n_points/2 buckets
+        method (str): 'lttb' or 'minmax', see lttb() and minmax_buckets()
+        log (bool): keep the shape of the series on a log scale
+        x_range (tuple): first and last date to keep, None keeps all dates
+        
+    Returns:
+    
+        data (DataFrame): the kept rows
+    
+    """
+    
+    if x_range is not None:
+        data = data.loc[(data['date'] >= pd.Timestamp(x_range[0])) & (data['date'] <= pd.Timestamp(x_range[1]))]
+    
+    keep = []
+    for _, group in data.groupby(data['country'].astype(str), sort=False):
+        group = group.sort_values('date')
+        x = group['date'].to_numpy().astype('datetime64[ns]').astype('int64')
+        y = group[metric].to_numpy(dtype=float)
+        if log:
+            y = np.log10(np.maximum(y, 1))
+        idx = lttb(x, y, n_points) if method == 'lttb' else minmax_buckets(x, y, max(n_points//2, 1))
+        keep.append(group.index.to_numpy()[idx])
+    
+    return data.loc[np.concatenate(keep) if keep else []]
+
+#Markers used for the countries in turn.
+COUNTRY_MARKERS = ['circle', 'square', 'triangle', 'circle_x', 'hex', 'diamond', 'inverted_triangle',
+                   'star', 'square_x', 'circle_cross', 'triangle_dot', 'plus']
+
+#Colors of n countries.
+def country_colors(n):
+    from bokeh.palettes import Category10, Category20, turbo
+    return Category10[max(n, 3)][:n] if n <= 10 else Category20[n] if n <= 20 else turbo(n)
+
+#Log-scale chart of a variable with one legend entry per country, which can be hidden by clicking it.
+def country_chart(data, metric, countries=None, title=None, y_axis_label=None, split=True, source=None,
+                  height=400, width=700, n_points=None, method='lttb'):
+    """ log-scale chart of a variable by country
+    
+    Args:
+    
+        data (DataFrame): data with columns date, country and metric
+        metric (str): variable to plot, e.g. 'total_cases' or 'total_deaths'
+        countries (list): country codes, None plots all countries in data
+        title (str): title of the chart
+        y_axis_label (str): label of the y axis
+        split (bool): give each country its own data source, otherwise each country is a view of one shared source
+        source (ColumnDataSource): shared source used when split is False, default is covid_source(data)
+        height (int): height of the chart
+        width (int): width of the chart
+        n_points (int): downsample each country to n_points, None plots all points, see downsample()
+        method (str): downsampling method, 'lttb' or 'minmax'
+        
+    Returns:
+    
+        p (figure): the chart
+    
+    """
+    
+    from bokeh.models import Legend
+    
+    if n_points is not None:
+        data = downsample(data, metric, n_points, method=method)
+    
+    countries = sorted(data['country'].astype(str).unique()) if countries is None else list(countries)
+    n = len(countries)
+    colors = country_colors(n)
+    columns = ['date', 'country', metric]
+    
+    p = figure(title=title or metric, x_axis_type='datetime', x_axis_label='Date',
+               y_axis_label=y_axis_label or metric, y_axis_type='log', height=height, width=width,
+               output_backend='webgl',
+               tools=['pan', 'wheel_zoom', 'box_zoom', 'reset',
+                      HoverTool(tooltips=[('Country','@country'), (metric, f'@{metric}'), ('Date','@date_formatted')])])
+    
+    if split:
+        groups = {str(country): group for country, group in data[columns].groupby(data['country'].astype(str), sort=False)}
+    elif source is None:
+        source = covid_source(data, columns)
+    
+    items = []
+    for i, country in enumerate(countries):
+        if split:
+            glyph_source, view = covid_source(groups[country], columns), CDSView()
+        else:
+            glyph_source, view = source, CDSView(filter=GroupFilter(column_name='country', group=country))
+        renderer = p.scatter(x='date', y=metric, source=glyph_source, view=view,
+                             marker=COUNTRY_MARKERS[i % len(COUNTRY_MARKERS)],
+                             size=6, color=colors[i], alpha=0.4)
+        items.append((country, [renderer]))
+    
+    legend = Legend(items=items, click_policy='hide', location='top_left')
+    if n > 10:
+        legend.ncols = -(-n//40)
+        p.add_layout(legend, 'right')
+    else:
+        p.add_layout(legend)
+    return p
+
+#Bokeh server application showing a downsampled chart, which is refined to full resolution when zooming.
+def zoom_app(data, metric, countries=None, n_points=200, method='lttb', **kwargs):
+    """ Bokeh server application of country_chart() with downsampling on zoom
+    
+    The chart starts with n_points per country. When the x range changes, the visible
+    dates are downsampled again, such that zooming in shows all points.
+    
+    Args:
+    
+        data (DataFrame): data with columns date, country and metric
+        metric (str): variable to plot
+        countries (list): country codes, None plots all countries in data
+        n_points (int): points per country in the visible range
+        method (str): downsampling method, 'lttb' or 'minmax'
+        **kwargs: passed to country_chart(), each country always has its own data source (split=True)
+        
+    Returns:
+    
+        modify_doc (callable): application function for bokeh.server.server.Server
+    
+    """
+    
+    columns = ['date', 'country', metric]
+    data = data.loc[data['country'].astype(str).isin(countries), columns] if countries is not None else data[columns]
+    kwargs = {**kwargs, 'split': True, 'source': None}
+    
+    def modify_doc(doc):
+        p = country_chart(data, metric, countries, n_points=n_points, method=method, **kwargs)
+        
+        def refine(attr, old, new):
+            start, end = (pd.Timestamp(v, unit='ms') for v in (p.x_range.start, p.x_range.end))
+            visible = downsample(data, metric, n_points, method=method, x_range=(start, end))
+            groups = dict(iter(visible.groupby(visible['country'].astype(str), sort=False)))
+            for item in p.select(type=LegendItem):
+                country = item.label.value
+                group = groups.get(country, visible.iloc[:0])
+                item.renderers[0].data_source.data = dict(covid_source(group, columns).data)
+        
+        p.x_range.on_change('start', refine)
+        p.x_range.on_change('end', refine)
+        doc.add_root(p)
+    
+    return modify_doc
+
+#Serve zoom_app() on a local Bokeh server, blocks until stopped.
+def serve_zoom_app(data, metric, port=5006, **kwargs):
+    from bokeh.server.server import Server
+    server = Server({'/': zoom_app(data, metric, **kwargs)}, port=port)
+    server.start()
+    print(f'Serving on http://localhost:{port}/')
+    server.io_loop.start()
+
+
+### COVID-19 and the stock market
+#
+# The stock market is closed on weekends and holidays, on these days the last closing value of the index is used.
+
+#Index market data by country with sorted dates.
+def market_index(frames):
+    """ index market data by country
+    
+    Args:
+    
+        frames (list): DataFrames with columns date, country and one or more index columns
+        
+    Returns:
+    
+        market (dict): for each country, 'dates' (sorted int64 dates), 'values' (2-D array, last value
+            of each index at or before the date) and 'columns' (names of the indices)
+    
+    """
+    
+    panel = pd.concat([frame.assign(country=frame['country'].astype(str)).set_index(['country', 'date']).sort_index()
+                       for frame in frames], axis=1).sort_index()
+    panel = panel.groupby(level='country').ffill()
+    
+    market = {}
+    columns = list(panel.columns)
+    for country, group in panel.groupby(level='country'):
+        market[country] = {'dates': group.index.get_level_values('date').to_numpy().astype('datetime64[ns]').astype('int64'),
+                           'values': group.to_numpy(dtype=float),
+                           'columns': columns}
+    return market
+
+#As-of merge of market data onto COVID-19 data.
+@staged('aggregate')
+def asof_join(covid, market, how='left', tolerance=None, chunk_size=2**20):
+    """ merge the last market values at or before each date onto the data
+    
+    Args:
+    
+        covid (DataFrame): data with columns date and country
+        market (dict): market data, see market_index()
+        how (str): 'left' keeps all rows, 'inner' keeps rows with market data
+        tolerance (Timedelta): maximum age of the market data, None allows any age
+        chunk_size (int): rows merged at a time
+        
+    Returns:
+    
+        covid_market (DataFrame): the data with the market indices and market_date, the date of the market data
+    
+    """
+    
+    columns = next(iter(market.values()))['columns'] if market else []
+    n = len(covid)
+    values = np.full((n, len(columns)), np.nan)
+    market_dates = np.full(n, np.iinfo('int64').min)
+    dates = covid['date'].to_numpy().astype('datetime64[ns]').astype('int64')
+    max_age = None if tolerance is None else pd.Timedelta(tolerance).value
+    
+    for country, rows in covid.groupby(covid['country'].astype(str), sort=False).indices.items():
+        if country not in market:
+            continue
+        m = market[country]
+        for start in range(0, rows.size, chunk_size):
+            chunk = rows[start:start+chunk_size]
+            pos = np.searchsorted(m['dates'], dates[chunk], side='right') - 1
+            valid = pos >= 0
+            if max_age is not None:
+                valid &= dates[chunk] - m['dates'][np.maximum(pos, 0)] <= max_age
+            values[chunk[valid]] = m['values'][pos[valid]]
+            market_dates[chunk[valid]] = m['dates'][pos[valid]]
+    
+    covid_market = covid.copy()
+    for i, col in enumerate(columns):
+        covid_market[col] = values[:, i]
+    covid_market['market_date'] = pd.to_datetime(np.where(market_dates == np.iinfo('int64').min, np.datetime64('NaT'),
+                                                          market_dates.astype('datetime64[ns]')))
+    if how == 'inner':
+        covid_market = covid_market.loc[covid_market['market_date'].notna()].reset_index(drop=True)
+    return covid_market
+
+#Sums over rolling windows of rows from cumulative sums, NaN for windows with missing values.
+def rolling_sums(values, window):
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    zero = np.zeros((1,) + values.shape[1:])
+    sums = np.concatenate([zero, np.cumsum(np.where(valid, values, 0), axis=0)])
+    counts = np.concatenate([zero, np.cumsum(valid, axis=0)])
+    out = np.full(values.shape, np.nan)
+    complete = counts[window:] - counts[:-window] == window
+    out[window-1:] = np.where(complete, sums[window:] - sums[:-window], np.nan)
+    return out
+
+#Rolling correlations of x and y along the first axis, the other axes are broadcast.
+def rolling_corr(x, y, window):
+    """ rolling-window correlations from cumulative sums
+    
+    Args:
+    
+        x (ndarray): values with time along the first axis
+        y (ndarray): values with time along the first axis, broadcast with x
+        window (int): rows in each window
+        
+    Returns:
+    
+        corr (ndarray): correlation of the window ending in each row, NaN for the first window-1 rows
+            and for windows with missing values
+    
+    """
+    
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    missing = np.isnan(x) | np.isnan(y)
+    
+    # a. centered values keep the differences of cumulative sums precise, series without values stay missing
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        x = np.where(missing, np.nan, x - np.nanmean(np.where(missing, np.nan, x), axis=0))
+        y = np.where(missing, np.nan, y - np.nanmean(np.where(missing, np.nan, y), axis=0))
+    
+    # b. moments of the windows
+    sx, sy = rolling_sums(x, window), rolling_sums(y, window)
+    sxx, syy, sxy = rolling_sums(x*x, window), rolling_sums(y*y, window), rolling_sums(x*y, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (sxy - sx*sy/window)/np.sqrt((sxx - sx**2/window)*(syy - sy**2/window))
+
+#Rolling OLS of y on a constant and X along the first axis, the other axes are broadcast.
+def rolling_ols(y, X, window):
+    """ rolling-window OLS from cumulative sums of cross products
+    
+    Args:
+    
+        y (ndarray): dependent variable with time along the first axis
+        X (ndarray): regressors along the last axis, broadcast with y[..., None]
+        window (int): rows in each window
+        
+    Returns:
+    
+        coef (ndarray): constant and slopes along the last axis of the window ending in each row,
+            NaN for the first window-1 rows and for windows with missing values or collinear regressors
+        r2 (ndarray): R-squared of the windows
+    
+    """
+    
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)[..., None]
+    X, y = np.broadcast_arrays(X, y)
+    y = y[..., 0]
+    missing = np.isnan(y) | np.isnan(X).any(axis=-1)
+    
+    # a. centered values, the constant is shifted back below, series without values stay missing
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        y_mean = np.nanmean(np.where(missing, np.nan, y), axis=0)
+        X_mean = np.nanmean(np.where(missing[..., None], np.nan, X), axis=0)
+    y = np.where(missing, np.nan, y - y_mean)
+    Z = np.concatenate([np.ones(X.shape[:-1] + (1,)), X - X_mean], axis=-1)
+    Z[missing] = np.nan
+    
+    # b. cross products of the windows
+    ZZ = rolling_sums(Z[..., :, None]*Z[..., None, :], window)
+    Zy = rolling_sums(Z*y[..., None], window)
+    yy = rolling_sums(y*y, window)
+    
+    # c. solve the normal equations of the windows that can be solved
+    coef = np.full(Zy.shape, np.nan)
+    ok = np.isfinite(ZZ).all(axis=(-2, -1))
+    ok[ok] = np.linalg.cond(ZZ[ok]) < 1e12
+    coef[ok] = np.linalg.solve(ZZ[ok], Zy[ok][..., None])[..., 0]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1 - (yy - (coef*Zy).sum(axis=-1))/(yy - Zy[..., 0]**2/window)
+    coef[..., 0] += y_mean - (coef[..., 1:]*X_mean).sum(axis=-1)
+    return coef, r2
+
+#Rolling correlations and OLS of index returns on COVID-19 growth rates.
+@staged('aggregate')
+def market_regressions(covid_stocks, indices=('SP500',), regressors=('total_cases_growth', 'total_deaths_growth'),
+                       lags=(0,), window=10):
+    """ rolling correlations and regressions of daily index returns on growth rates
+    
+    Only trading days (date equal to market_date) are used. All countries, indices and lags are
+    computed at once.
+    
+    Args:
+    
+        covid_stocks (DataFrame): data with market data, see asof_join(), and the regressors, see add_growth()
+        indices (tuple): market indices, the dependent variables are their daily log returns
+        regressors (tuple): regressors, e.g. growth rates of total cases and deaths
+        lags (tuple): trading days the regressors are lagged
+        window (int): trading days in each window
+        
+    Returns:
+    
+        regressions (DataFrame): by date, country, index and lag the columns corr_<regressor>,
+            const, beta_<regressor> and r2 of the window ending on the date
+    
+    """
+    
+    indices, regressors, lags = list(indices), list(regressors), list(lags)
+    columns = (['date', 'lag', 'index', 'country'] + [f'corr_{reg}' for reg in regressors] + ['const']
+               + [f'beta_{reg}' for reg in regressors] + ['r2'])
+    
+    # a. (dates x countries) panels of the trading days, none if no country has market data
+    trading = covid_stocks.loc[covid_stocks['date'] == covid_stocks['market_date']]
+    if trading.empty:
+        dtypes = {'date': 'datetime64[ns]', 'lag': 'int64', 'index': object, 'country': object}
+        return pd.DataFrame({column: pd.Series(dtype=dtypes.get(column, 'float64')) for column in columns})
+    trading = trading.assign(country=trading['country'].astype(str))
+    panel = trading.pivot(index='date', columns='country', values=indices + regressors).sort_index()
+    dates = panel.index
+    countries = list(panel[indices[0]].columns)
+    
+    returns = np.stack([np.log(panel[index][countries].to_numpy(dtype=float)) for index in indices], axis=1)
+    returns[1:] -= returns[:-1].copy()
+    returns[0] = np.nan
+    growth = np.stack([panel[reg][countries].to_numpy(dtype=float) for reg in regressors], axis=-1)
+    
+    # b. lagged regressors, (dates x lags x indices x countries x regressors), missing for lags of all trading days or more
+    X = np.full((len(dates), len(lags), 1, len(countries), len(regressors)), np.nan)
+    for i, lag in enumerate(lags):
+        if lag < len(dates):
+            X[lag:, i, 0] = growth[:len(dates)-lag]
+    y = returns[:, None]
+    
+    # c. rolling correlations and regressions
+    corr = rolling_corr(X, y[..., None], window)
+    coef, r2 = rolling_ols(y, X, window)
+    
+    # d. long format
+    index = pd.MultiIndex.from_product([dates, lags, indices, countries], names=['date', 'lag', 'index', 'country'])
+    regressions = pd.DataFrame({f'corr_{reg}': corr[..., j].ravel() for j, reg in enumerate(regressors)}, index=index)
+    regressions['const'] = coef[..., 0].ravel()
+    for j, reg in enumerate(regressors):
+        regressions[f'beta_{reg}'] = coef[..., j+1].ravel()
+    regressions['r2'] = r2.ravel()
+    return regressions.dropna(how='all').reset_index()[columns]
+
+#Add the rolling results of one index and lag to the rows of the data, see market_regressions().
+def add_regressions(covid_stocks, regressions, index='SP500', lag=0):
+    selected = regressions.loc[(regressions['index'] == index) & (regressions['lag'] == lag)]
+    selected = selected.drop(columns=['index', 'lag']).astype({'country': str})
+    covid_stocks = covid_stocks.assign(_country=covid_stocks['country'].astype(str))
+    merged = covid_stocks.merge(selected.rename(columns={'country': '_country', 'date': 'market_date'}),
+                                on=['market_date', '_country'], how='left')
+    return merged.drop(columns='_country')
+
+
+#Log-scale chart of a variable with one marker and color per country, the hover tool shows the doubling time.
+def marker_chart(source, metric, title, y_axis_label, label, countries=COUNTRIES, fill_alpha=0.4):
+    """ log-scale chart of a variable with the hover tool on
+    
+    Args:
+    
+        source (ColumnDataSource): data source, see covid_source(), with the columns metric and metric_doubling
+        metric (str): variable to plot, e.g. 'total_cases' or 'total_deaths'
+        title (str): title of the chart
+        y_axis_label (str): label of the y axis
+        label (str): name of the variable in the hover tool
+        countries (list): country codes in the source
+        fill_alpha (float): opacity of the markers
+        
+    Returns:
+    
+        p (figure): the chart
+    
+    """
+    
+    countries = sorted(countries)
+    markers = MARKERS if countries == COUNTRIES else [COUNTRY_MARKERS[i % len(COUNTRY_MARKERS)] for i in range(len(countries))]
+    
+    p = figure(title=title, x_axis_type='datetime', 
+               x_axis_label='Date', y_axis_label=y_axis_label, y_axis_type="log", height=400, width=700,
+               tools=[HoverTool(tooltips=[('Country','@country'),(label, f'@{metric}'), ('Doubling Time (Days)', f'@{metric}_doubling{{0.0}}'), ('Date','@date_formatted')])])
+    
+    p.scatter("date", metric, source=source, fill_alpha=fill_alpha, size=6,
+              marker=factor_mark('country', markers, countries),
+              color=factor_cmap('country', country_colors(len(countries)), countries))
+    return p
+
+#Chart of the S&P 500 index over time.
+def sp500_chart(source):
+    p = figure(title='SP500', x_axis_type='datetime', 
+               x_axis_label='Date', y_axis_label='SP500', height=400, width=700, 
+               tools=[HoverTool(tooltips=[('SP500','@SP500' ), ('Date','@date_formatted')])])
+    p.scatter(x='date', y='SP500', source=source, size=8, color='red', alpha=0.4)
+    return p
+
+#Scatter of the S&P 500 index against daily confirmed cases, with a fitted line and the rolling results in the hover tool.
+def sp500_scatter(source, fit=None):
+    """ scatter of the S&P 500 index against daily confirmed cases
+    
+    Args:
+    
+        source (ColumnDataSource): data source, see covid_source(), the rolling correlation and beta of
+            returns on case growth are shown when the source has their columns, see add_regressions()
+        fit (tuple): constant and slope of a line to draw, see scatter_fit()
+        
+    Returns:
+    
+        p (figure): the chart
+    
+    """
+    
+    tooltips = [('SP500','@SP500' ), ('Date','@date_formatted'), ('Cases','@cases' ), ('Deaths','@deaths' )]
+    if 'corr_total_cases_growth' in source.data:
+        tooltips += [('Rolling Correlation (Returns, Case Growth)', '@corr_total_cases_growth{0.00}'),
+                     ('Rolling Beta (Returns, Case Growth)', '@beta_total_cases_growth{0.000}')]
+    p = figure(title='SP500', x_axis_label='Daily Confirmed Cases of Covid-19', y_axis_label='SP500', height=400, width=700, 
+               tools=[HoverTool(tooltips=tooltips)])
+    p.scatter(x='cases', y='SP500', source=source, size=8, color='blue', alpha=0.4)
+    if fit is not None:
+        x = np.array([np.nanmin(source.data['cases']), np.nanmax(source.data['cases'])], dtype=float)
+        p.line(x, fit[0] + fit[1]*x, color='black', line_dash='dashed', legend_label=f'OLS, slope {fit[1]:.4f}')
+        p.legend.location = 'bottom_right'
+    return p
+
+#Constant and slope of the OLS of y on x over all rows, see rolling_ols(), None if there are no rows to fit.
+def scatter_fit(data, x='cases', y='SP500'):
+    data = data[[x, y]].dropna()
+    if data.empty:
+        return None
+    coef, _ = rolling_ols(data[y].to_numpy(), data[[x]].to_numpy(), len(data))
+    return tuple(coef[-1]) if np.isfinite(coef[-1]).all() else None
+
+#Columns of the data source of the COVID-19 charts.
+COVID_CHART_COLUMNS = ['date', 'country', 'cases', 'deaths', 'total_cases', 'total_deaths',
+                       'total_cases_doubling', 'total_deaths_doubling']
+
+#Log-scale chart of total cases with the hover tool on, source is built from covid if not given.
+def cases_chart(covid, source=None):
+    source = covid_source(covid, COVID_CHART_COLUMNS) if source is None else source
+    return marker_chart(source, 'total_cases', 'Total Number of Confirmed COVID-19 Cases', 'Log Cases', 'Confirmed Cases',
+                        sorted(covid['country'].astype(str).unique()))
+
+#Log-scale chart of total cases with series-hiding on.
+def cases_legend_chart(covid, source=None):
+    return country_chart(covid, 'total_cases', sorted(covid['country'].astype(str).unique()), y_axis_label='Log Cases',
+                         split=False, source=source,
+                         title='Total Confirmed COVID-19 Cases (Click on legend entries to hide the corresponding datapoints)')
+
+#Log-scale chart of total deaths with the hover tool on, source is built from covid if not given.
+def deaths_chart(covid, source=None):
+    source = covid_source(covid, COVID_CHART_COLUMNS) if source is None else source
+    return marker_chart(source, 'total_deaths', 'Total Number of COVID-19 Deaths', 'Log Deaths', 'Deaths',
+                        sorted(covid['country'].astype(str).unique()), fill_alpha=0.3)
+
+#Log-scale chart of total deaths with series-hiding on.
+def deaths_legend_chart(covid, source=None):
+    return country_chart(covid, 'total_deaths', sorted(covid['country'].astype(str).unique()), y_axis_label='Log Deaths',
+                         split=False, source=source,
+                         title='Total Number of COVID-19 Deaths (Click on legend entries to hide the corresponding datapoints)')
+
+#The four COVID-19 charts, sharing one data source.
+def covid_charts(covid):
+    source = covid_source(covid, COVID_CHART_COLUMNS)
+    return [chart(covid, source) for chart in [cases_chart, cases_legend_chart, deaths_chart, deaths_legend_chart]]
+
+### Report pipeline
+#
+# The report is built in four stages: load -> clean -> aggregate -> render. The output of each stage is
+# stored with a key of its inputs (the versions of the workbooks, the settings and this file), and a stage
+# only runs when its key changes. The charts are independent and rendered in parallel processes.
+
+#Charts of the report: file name, title, data used and how the chart is built from the data, a list of charts is a dashboard.
+REPORT_CHARTS = {
+    'COVID19_1.html': ('Total Number of Confirmed COVID-19 Cases', 'covid', cases_chart),
+    'COVID19_2.html': ('Total Confirmed COVID-19 Cases (Click on legend entries to hide the corresponding datapoints', 'covid', cases_legend_chart),
+    'COVID19_3.html': ('Total Number of COVID-19 Deaths', 'covid', deaths_chart),
+    'COVID19_4.html': ('Total Number of COVID-19 Deaths (Click on legend entries to hide the corresponding datapoints', 'covid', deaths_legend_chart),
+    'COVID19_dashboard.html': ('Total Number of Confirmed COVID-19 Cases and Deaths', 'covid', covid_charts),
+    'COVID19_5.html': ('SP500', 'covid_stocks', lambda data: sp500_chart(covid_source(data))),
+    'COVID19_6.html': ('Scatter SP500 COVID-Cases', 'covid_stocks', lambda data: sp500_scatter(covid_source(data), scatter_fit(data))),
+}
+
+#Key identifying the inputs of a stage.
+def stage_key(*inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+#Version of this file, part of every key such that changed code reruns the stages.
+def code_version():
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+#Run a stage, or read its stored output if the key of its inputs is unchanged.
+def run_stage(name, key, compute, folder):
+    """ run a stage of the report with stored output
+    
+    Args:
+    
+        name (str): name of the stage
+        key (str): key of the inputs of the stage, see stage_key()
+        compute (callable): compute() returns the output as a dict of DataFrames
+        folder (str): folder of the stored output
+        
+    Returns:
+    
+        output (dict): the DataFrames of the stage
+        ran (bool): True if the stage ran, False if the stored output was used
+    
+    """
+    
+    meta_path = os.path.join(folder, f'{name}.json')
+    
+    # a. stored output
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        paths = {out: os.path.join(folder, file) for out, file in meta['files'].items()}
+        if meta['key'] == key and all(os.path.exists(path) for path in paths.values()):
+            return {out: pd.read_parquet(path) for out, path in paths.items()}, False
+    
+    # b. run and store
+    os.makedirs(folder, exist_ok=True)
+    output = compute()
+    files = {out: f'{name}-{out}.parquet' for out in output}
+    for out, frame in output.items():
+        frame.to_parquet(os.path.join(folder, files[out]))
+    with open(meta_path, 'w') as f:
+        json.dump({'key': key, 'files': files}, f)
+    return output, True
+
+#Render one chart of REPORT_CHARTS to a file, used by render_report().
+def _render_chart(name, data, path):
+    title, _, build = REPORT_CHARTS[name]
+    chart = build(data)
+    if isinstance(chart, list):
+        dashboard(chart, path, title)
+    else:
+        save(chart, filename=path, resources='cdn', title=title)
+    return path
+
+#Render the charts of the report in parallel processes, skipping charts whose inputs are unchanged.
+@staged('render')
+def render_report(frames, key, folder, workers=None, refresh=False):
+    """ render the charts of the report
+    
+    Args:
+    
+        frames (dict): the DataFrames covid, covid_ref and covid_stocks
+        key (str): key of the inputs of the charts, see stage_key()
+        folder (str): output folder
+        workers (int): number of processes, default is all cores, 1 renders in this process
+        refresh (bool): render all charts even if their inputs are unchanged
+        
+    Returns:
+    
+        rendered (list): paths of the files rendered, files with unchanged inputs are not rendered again
+    
+    """
+    
+    os.makedirs(folder, exist_ok=True)
+    meta_path = os.path.join(folder, 'render.json')
+    meta = {}
+    if os.path.exists(meta_path) and not refresh:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    changed = lambda file: meta.get(file) != key or not os.path.exists(os.path.join(folder, file))
+    
+    # a. charts, see REPORT_CHARTS
+    jobs = [(name, frames[data], os.path.join(folder, name)) for name, (_, data, _) in REPORT_CHARTS.items() if changed(name)]
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 1 or len(jobs) <= 1:
+        rendered = [_render_chart(*job) for job in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            rendered = list(executor.map(_render_chart, *zip(*jobs)))
+    
+    # b. one figure per country, see render_countries()
+    countries = [country for country in sorted(frames['covid']['country'].astype(str).unique()) if changed(f'{country}.png')]
+    rendered += render_countries(frames['covid_ref'], countries, folder, workers=workers)
+    
+    # c. store the keys
+    meta.update({os.path.basename(path): key for path in rendered})
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return rendered
+
+#Build the report without IPython.
+def report(folder='report', countries=COUNTRIES, start=START, end=END, window=7,
+           data_dir=DATA_DIR, cache_dir=CACHE_DIR, refresh=False, workers=None):
+    """ build the report: load -> clean -> aggregate -> render
+    
+    Args:
+    
+        folder (str): output folder of the charts and tables
+        countries (list): country codes, None includes all countries
+        start (str): first date
+        end (str): last date
+        window (int): days in the rolling windows, see add_growth() and market_regressions()
+        data_dir (str): folder of the workbooks
+        cache_dir (str): folder of the Parquet cache of the workbooks
+        refresh (bool): read the workbooks and run all stages even if nothing changed
+        workers (int): number of processes rendering the charts, default is all cores
+        
+    Returns:
+    
+        frames (dict): the DataFrames of the stages
+        ran (dict): for each stage, True if it ran and False if its stored output was used
+    
+    """
+    
+    stages = os.path.join(folder, '.stages')
+    if refresh and os.path.exists(stages):
+        for f in os.listdir(stages):
+            os.remove(os.path.join(stages, f))
+    sources = {name: os.path.join(data_dir, DATASETS[name]['source']) for name in ['covid', 'sp500']}
+    ran = {}
+    
+    # a. load
+    versions = {name: source_version(source) for name, source in sources.items()}
+    key = stage_key('load', code_version(), versions, countries, start, end)
+    frames, ran['load'] = run_stage('load', key, lambda: {
+        'covid': load_covid(sources['covid'], cache_dir, refresh, countries, start, end, KEEP_COLUMNS),
+        'sp500': load('sp500', source=sources['sp500'], cache_dir=cache_dir, refresh=refresh)}, stages)
+    
+    # b. clean
+    key = stage_key('clean', key, window)
+    def clean():
+        with stage('filter', len(frames['covid'])) as record:
+            covid = frames['covid'].dropna(subset=['country']).reset_index(drop=True)
+            record['rows_out'] = len(covid)
+        covid = add_growth(add_totals(covid), window)
+        return {'covid': covid, 'covid_ref': wide_format(covid)}
+    cleaned, ran['clean'] = run_stage('clean', key, clean, stages)
+    frames.update(cleaned)
+    
+    # c. aggregate
+    key = stage_key('aggregate', key)
+    def aggregate():
+        covid_stocks = asof_join(frames['covid'], market_index([frames['sp500']]), how='inner')
+        regressions = market_regressions(covid_stocks, window=window)
+        return {'summary': covid_summary(frames['covid'], per_capita=True),
+                'covid_stocks': add_regressions(covid_stocks, regressions),
+                'market_regressions': regressions}
+    aggregated, ran['aggregate'] = run_stage('aggregate', key, aggregate, stages)
+    frames.update(aggregated)
+    
+    # d. render
+    rendered = render_report(frames, key, folder, workers=workers, refresh=refresh)
+    if ran['aggregate'] or not os.path.exists(os.path.join(folder, 'summary.csv')):
+        frames['summary'].to_csv(os.path.join(folder, 'summary.csv'))
+        frames['market_regressions'].to_csv(os.path.join(folder, 'market_regressions.csv'), index=False)
+    ran['render'] = len(rendered) > 0
+    
+    return frames, ran
+
+#Assert that storing the data day by day gives the same totals as computing them at once.
+def check_daily_updates(covid, store):
+    if os.path.exists(store):
+        for f in os.listdir(store):
+            os.remove(os.path.join(store, f))
+    append_covid(store, covid.loc[covid['date'] < covid['date'].max(), ['date', 'country', 'cases', 'deaths']])
+    new, state = append_covid(store, covid.loc[covid['date'] == covid['date'].max(), ['date', 'country', 'cases', 'deaths']])
+    assert check_store(store)
+    assert (new.set_index('country')[['total_cases', 'total_deaths']] == covid.groupby('country', observed=True)[['total_cases', 'total_deaths']].last()).all().all()
+    assert summary_from_partial(state).equals(covid_summary(covid))
+    return True
+
+
+### Report of dataproject.ipynb
+
+if __name__ == '__main__':
+    
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Build the COVID-19 report (charts and summary statistics) without IPython.')
+    parser.add_argument('folder', nargs='?', default='report', help='output folder')
+    parser.add_argument('--countries', nargs='+', default=COUNTRIES, help="country codes, 'all' for all countries")
+    parser.add_argument('--start', default=START)
+    parser.add_argument('--end', default=END)
+    parser.add_argument('--window', type=int, default=7, help='days in the rolling windows')
+    parser.add_argument('--workers', type=int, default=None, help='processes rendering the charts')
+    parser.add_argument('--refresh', action='store_true', help='read the workbooks and run all stages')
+    parser.add_argument('--check', action='store_true', help='check the daily update store against the full data')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='PATH',
+                        help='time the stages and write the report to PATH, default is profile.json in the output folder')
+    args = parser.parse_args()
+    if args.profile is not None:
+        profiling(True)
+    
+    countries = None if args.countries == ['all'] else args.countries
+    frames, ran = report(args.folder, countries, args.start, args.end, args.window,
+                         refresh=args.refresh, workers=args.workers)
+    
+    for name, did_run in ran.items():
+        print(f'{name:10s} {"ran" if did_run else "unchanged"}')
+    
+    summary = frames['summary']
+    print(summary[['cases_mean', 'deaths_mean']].round(1))
+    print(summary[['cases_max', 'deaths_max', 'cases_peak', 'deaths_peak']])
+    print(summary[['total_cases', 'total_deaths', 'total_cases_per_100k', 'total_deaths_per_100k']].round(1))
+    print(frames['market_regressions'].set_index(['date', 'country', 'index', 'lag']).tail().round(3).to_string())
+    
+    if args.check:
+        assert check_daily_updates(frames['covid'], os.path.join(CACHE_DIR, 'covid_store'))
+        print('daily updates match the full data')
+    
+    if instrumentation.PROFILE:
+        stage_report(args.profile or os.path.join(args.folder, 'profile.json'))
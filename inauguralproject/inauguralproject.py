@@ -1,15 +1,110 @@
-def square(x):
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# elements per chunk, 2**16 float64 values (512 kB) stay in the cache of a core
+CHUNK_SIZE = 2**16
+
+def elementwise(func, x, out=None, chunk_size=CHUNK_SIZE, workers=None):
+    """ apply an elementwise numpy function in chunks across a thread pool
+
+    The input is processed in chunks of chunk_size elements, such that no temporary arrays
+    of the full size are allocated and memory-mapped inputs are read a chunk at a time.
+    NumPy releases the GIL in its ufuncs, so the threads run in parallel.
+
+    Args:
+
+        func (ufunc): elementwise function with an out argument, e.g. np.square
+        x (ndarray): input array, can be a np.memmap
+        out (ndarray): output array with the shape of x, can be x itself (in place) or a np.memmap,
+            default is a new array with the dtype of func(x)
+        chunk_size (int): elements in each chunk
+        workers (int): number of threads, default is all cores
+
+    Returns:
+
+        out (ndarray): output array
+
+    """
+
+    if out is None:
+        out = np.empty(x.shape, dtype=func(x.flat[:1]).dtype if x.size > 0 else x.dtype)
+    if out.shape != x.shape:
+        raise ValueError(f'out has shape {out.shape}, expected {x.shape}')
+
+    # a. small or non-contiguous arrays in one call
+    workers = os.cpu_count() if workers is None else workers
+    if x.size <= chunk_size or not (x.flags.c_contiguous and out.flags.c_contiguous):
+        func(x, out=out)
+        return out
+
+    # b. one contiguous span per thread, each processed chunk by chunk
+    x_flat, out_flat = x.reshape(-1), out.reshape(-1)
+    n_chunks = -(-x.size//chunk_size)
+    bounds = np.linspace(0, n_chunks, min(workers, n_chunks)+1).astype(int)*chunk_size
+
+    def run(start, stop):
+        for i in range(start, min(stop, x.size), chunk_size):
+            j = min(i+chunk_size, stop, x.size)
+            func(x_flat[i:j], out=out_flat[i:j])
+
+    if len(bounds) == 2:
+        run(bounds[0], bounds[1])
+    else:
+        with ThreadPoolExecutor(max_workers=len(bounds)-1) as executor:
+            list(executor.map(run, bounds[:-1], bounds[1:]))
+
+    return out
+
+def elementwise_file(func, path, out_path=None, chunk_size=CHUNK_SIZE, workers=None):
+    """ apply an elementwise numpy function to a .npy file without loading it into memory
+
+    Args:
+
+        func (ufunc): elementwise function with an out argument, e.g. np.square
+        path (str): input .npy file
+        out_path (str): output .npy file, default is to overwrite the input file
+        chunk_size (int): elements in each chunk
+        workers (int): number of threads, default is all cores
+
+    Returns:
+
+        out (np.memmap): memory-mapped output array
+
+    """
+
+    if out_path is None:
+        x = np.load(path, mmap_mode='r+')
+        out = x
+    else:
+        x = np.load(path, mmap_mode='r')
+        dtype = func(np.zeros(1, dtype=x.dtype)).dtype
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=x.shape)
+
+    elementwise(func, x, out=out, chunk_size=chunk_size, workers=workers)
+    out.flush()
+    return out
+
+def square(x, out=None, chunk_size=CHUNK_SIZE, workers=None):
     """ square numpy array
-    
+
     Args:
-    
-        x (ndarray): input array
-        
+
+        x (ndarray): input array, can be a np.memmap
+        out (ndarray): output array, can be x itself to square in place, default is a new array
+        chunk_size (int): elements in each chunk, see elementwise()
+        workers (int): number of threads, default is all cores
+
     Returns:
-    
-        y (ndarray): output array
-    
+
+        y (ndarray): output array with the dtype of x
+
     """
-    
-    y = x**2
-    return y
\ No newline at end of file
+
+    if not isinstance(x, np.ndarray):
+        y = x**2 if out is None else np.square(x, out=out)
+        return y
+
+    y = elementwise(np.square, x, out=out, chunk_size=chunk_size, workers=workers)
+    return y
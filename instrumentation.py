@@ -0,0 +1,133 @@
+## Instrumentation
+#
+# Stages of the projects (dataproject.py and modelproject.py) are timed when profiling is switched on,
+# with profiling(True) or the environment variable of a project, see profiling_from_env(). For each stage
+# the wall and CPU time, the rows in and out and the peak of memory allocated (tracemalloc) are recorded,
+# see stage_report(). The records are shared by the projects, such that the memory peaks of nested stages
+# are folded into one stack.
+
+import os
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+
+PROFILE = False
+
+# records of the finished stages and the stack of open stages
+_STAGES = []
+_OPEN = []
+
+def profiling(on=True):
+    """ switch profiling on or off and clear the records """
+    global PROFILE
+    PROFILE = on
+    _STAGES.clear()
+    if on and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def profiling_from_env(name):
+    """ switch profiling on if the environment variable name is set and not 0, keeping the records so far """
+    if os.environ.get(name, '0') not in ('', '0') and not PROFILE:
+        profiling(True)
+
+def _fold_peak():
+    """ fold the memory peak since the last reset into the open stages """
+    current, peak = tracemalloc.get_traced_memory()
+    for record in _OPEN:
+        record['_peak'] = max(record['_peak'], peak)
+    tracemalloc.reset_peak()
+    return current
+
+@contextlib.contextmanager
+def stage(name, rows=None, label=None):
+    """ time a stage when profiling is on
+
+    Args:
+
+        name (str): name of the stage, e.g. 'load', 'aggregate', 'render', 'symbolic_solve' or 'numeric_sweep'
+        rows (int): rows or elements into the stage
+        label (str): what runs in the stage, e.g. the name of a function
+
+    Returns:
+
+        record (dict): record of the stage, rows_out can be set by the caller
+
+    """
+
+    record = {'stage': name, 'label': label, 'depth': len(_OPEN), 'rows_in': rows, 'rows_out': None}
+    if not PROFILE:
+        yield record
+        return
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    record['_start'] = record['_peak'] = _fold_peak()
+    _OPEN.append(record)
+    _STAGES.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall'] = time.perf_counter() - wall
+        record['cpu'] = time.process_time() - cpu
+        current = _fold_peak()
+        _OPEN.remove(record)
+        record['memory_mb'] = (record.pop('_peak') - record['_start'])/2**20
+        record['net_memory_mb'] = (current - record.pop('_start'))/2**20
+
+def staged(name, rows_in, rows_out):
+    """ decorator recording each call of a function as a stage
+
+    Args:
+
+        name (str): name of the stage, see stage()
+        rows_in (callable): rows_in(args, kwargs) returns the rows into the stage from the arguments of a call
+        rows_out (callable): rows_out(result) returns the rows of the result
+
+    Returns:
+
+        decorator (callable): the decorator
+
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE:
+                return func(*args, **kwargs)
+            with stage(name, rows_in(args, kwargs), func.__name__) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = rows_out(result)
+            return result
+        return wrapper
+    return decorator
+
+def stage_report(path=None, echo=True):
+    """ report of the stages recorded while profiling
+
+    Args:
+
+        path (str): JSON file to write the report to, None writes no file
+        echo (bool): print the report as a table
+
+    Returns:
+
+        report (list): one dict per finished stage in the order the stages started, with stage, label, depth,
+            rows_in, rows_out, wall and cpu (seconds, cpu of this process), memory_mb (peak allocated) and net_memory_mb
+
+    """
+
+    report = [dict(record) for record in _STAGES if 'wall' in record]
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+    if echo:
+        print(f"{'stage':40s} {'rows in':>10s} {'rows out':>10s} {'wall (s)':>9s} {'cpu (s)':>9s} {'memory (MB)':>12s}")
+        for record in report:
+            rows_in, rows_out = ('' if record[k] is None else record[k] for k in ['rows_in', 'rows_out'])
+            name = record['stage'] + (f" ({record['label']})" if record['label'] else '')
+            print(f"{'  '*record['depth'] + name:40s} {rows_in:>10} {rows_out:>10} "
+                  f"{record['wall']:9.4f} {record['cpu']:9.4f} {record['memory_mb']:12.1f}")
+    return report
@@ -1,475 +1,878 @@
-# To add a new cell, type '# %%'
-# To add a new markdown cell, type '# %% [markdown]'
-# %%
-from IPython import get_ipython
-
-# %% [markdown]
-# ## Model Project
-# 
-# For the following project, we consider the exam in Microeconomics I from 2019, winter. We wish to solve problem 2 and 3. 
-# 
-# We solve the utility maximization problem given a particular utility function. First, we find a general solution and map the indifference curves for certain levels of utility. Thereafter, we find optimal solutions for given levels of Income and prices.
-# 
-# Given a production function and certain cost_structure we solve a firm's profit maximization problem and find the firm's optimal quantity produced. Furthermore, given, price, factor prices and fixed costs we find the optimal conditional factor demands of labour, $l$, and capital, $k$, the optimal quantity and subsequent profit.
-# %% [markdown]
-# **Imports and set magics**
-
-# %%
+## Model Project
+#
+# For the following project, we consider the exam in Microeconomics I from 2019, winter. We wish to solve problem 2 and 3.
+#
+# The functions used in modelproject.ipynb are collected here. The module only imports numpy when imported.
+# SymPy (symbolic solutions) and matplotlib (figures) are imported on first use, such that the numerical
+# functions can be used in short-lived worker processes. Running the file as a script reproduces the
+# results of the notebook.
+
+import os
+import sys
+import json
+import types
+import hashlib
+import functools
+import importlib
+import subprocess
+
 import numpy as np
-from scipy import optimize
-import sympy as sm
-from sympy import Symbol
-from sympy.solvers import solve
-import matplotlib.pyplot as plt
-
-from sympy import *
-sm.init_printing(use_unicode=True)
-from scipy.misc import derivative
-
-# autoreload modules when code is run
-get_ipython().run_line_magic('load_ext', 'autoreload')
-get_ipython().run_line_magic('autoreload', '2')
-
-# %% [markdown]
-# ### 1. Consumer Theory
-# 
-# We consider a consumer with utility given by:
-# 
-# $u(x_1, x_2) = 8 \sqrt{x_1} + x_2$         $(1)$
-# 
-# The possible consumption frontier is $(x_1, x_2) \in \mathbb{R}_+^2$. The prices of the two goods, $x_1, x_2$, are given by $p_1$ and $p_2$ respectively. Income is given by $I$, and we assume $p_1, p_2, I >0$ 
-# %% [markdown]
-# **1.1 Indifference curves**
-# 
-# We wish to draw the indifference curves for different values of utility, such as to visualize consumption bundles for set level of utility. From $(1)$ we isolate to $x_2$ such that:
-# 
-# $u_0 = 8 \sqrt{x_1} + x_2 \Leftrightarrow x_2 = u_0 - 8 \sqrt{x_1}$ 
-
-# %%
-# Define utility function, $x_2$ as a function of $x_1$.
+
+# the profiling of the stages is shared with dataproject.py, see instrumentation.py in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import instrumentation
+from instrumentation import profiling, profiling_from_env, stage, stage_report
+
+# maximum time in seconds for 'import modelproject' in a fresh interpreter, see import_time()
+IMPORT_TIME_BUDGET = 0.5
+
+
+### Lazy imports
+
+def _sympy():
+    """ import sympy on first use """
+    return importlib.import_module('sympy')
+
+def _pyplot():
+    """ import matplotlib.pyplot on first use """
+    return importlib.import_module('matplotlib.pyplot')
+
+def import_time(budget=IMPORT_TIME_BUDGET):
+    """ measure the time it takes to import this module in a fresh interpreter
+
+    Args:
+
+        budget (float): maximum allowed import time in seconds, None to skip the check
+
+    Returns:
+
+        seconds (float): import time
+
+    """
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    code = ('import sys, time; sys.path.insert(0, sys.argv[1]); t0 = time.perf_counter(); '
+            'import modelproject; print(time.perf_counter() - t0)')
+    out = subprocess.run([sys.executable, '-c', code, folder], check=True, capture_output=True, text=True)
+    seconds = float(out.stdout)
+
+    if budget is not None and seconds > budget:
+        raise RuntimeError(f'importing modelproject took {seconds:.3f}s, the budget is {budget:.3f}s')
+    return seconds
+
+
+### Instrumentation
+
+# stages are timed when profiling is on, with profiling(True) or the environment variable
+# MODELPROJECT_PROFILE=1 (or the path of a JSON file for the report), see instrumentation.py in the folder above
+profiling_from_env('MODELPROJECT_PROFILE')
+
+def _rows(obj):
+    """ number of elements of a result, the first of a tuple or dict """
+    if isinstance(obj, (tuple, list)) and obj:
+        obj = obj[0]
+    elif isinstance(obj, dict) and obj:
+        obj = next(iter(obj.values()))
+    return int(np.size(obj)) if isinstance(obj, np.ndarray) else None
+
+def _rows_in(args, kwargs):
+    """ size of the largest array argument """
+    return max([np.size(a) for a in [*args, *kwargs.values()] if isinstance(a, np.ndarray)], default=None)
+
+def staged(name):
+    """ decorator recording each call of a function as a stage, with the size of the largest array argument and of the result """
+    return instrumentation.staged(name, _rows_in, _rows)
+
+
+### Symbolic solutions and cache
+
+@functools.lru_cache(maxsize=None)
+def symbols():
+    """ sympy symbols of the consumer and firm problems """
+
+    sm = _sympy()
+    s = types.SimpleNamespace()
+    s.I = sm.symbols('I')
+    s.lam = sm.symbols('\\lambda')
+    s.p_1, s.p_2 = sm.symbols('p_1 p_2')
+    s.x_1, s.x_2 = sm.symbols('x_1 x_2')
+    s.x, s.l, s.k, s.w, s.r, s.FC, s.p = sm.symbols('x l k w r FC p')
+    return s
+
+def _or_symbols(**kwargs):
+    """ replace arguments which are None with the symbol of the same name """
+    s = symbols()
+    return [getattr(s, name) if value is None else value for name, value in kwargs.items()]
+
+# folder for the cache of symbolic solutions
+CACHE_DIR = os.environ.get('MODELPROJECT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'modelproject'))
+
+def _code_key(func, seen=None):
+    """ hash of the code of func and of the functions of this module it calls, recursively """
+
+    seen = set() if seen is None else seen
+    seen.add(func.__name__)
+    h = hashlib.sha256()
+    codes = [func.__code__]
+    while codes:
+        code = codes.pop()
+        h.update(code.co_code)
+        h.update(repr([c for c in code.co_consts if not isinstance(c, types.CodeType)]).encode())
+        codes += [c for c in code.co_consts if isinstance(c, types.CodeType)]
+        for name in code.co_names:
+            called = globals().get(name)
+            if isinstance(called, types.FunctionType) and called.__module__ == __name__ and name not in seen:
+                h.update(_code_key(called, seen).encode())
+    return h.hexdigest()
+
+def _to_tree(expr):
+    """ JSON tree of a sympy expression: the class name followed by the arguments, see _from_tree() """
+
+    if expr.is_Symbol:
+        return ['Symbol', expr.name, expr.assumptions0]
+    if expr.is_Integer:
+        return ['Integer', int(expr)]
+    if expr.is_Rational:
+        return ['Rational', int(expr.p), int(expr.q)]
+    if expr.is_Float:
+        return ['Float', str(expr), expr._prec]
+    if not expr.args:
+        return ['S', type(expr).__name__]
+    return [type(expr).__name__] + [_to_tree(arg) for arg in expr.args]
+
+def _from_tree(tree):
+    """ sympy expression of a tree from _to_tree()
+
+    Only sympy classes are instantiated and no text is evaluated, unlike sympify() of an srepr,
+    such that a modified cache file cannot run code. Raises ValueError for anything else.
+    """
+
+    sm = _sympy()
+    name, *args = tree
+    if name == 'Symbol':
+        return sm.Symbol(str(args[0]), **{str(k): bool(v) for k, v in args[1].items()})
+    if name == 'Integer':
+        return sm.Integer(int(args[0]))
+    if name == 'Rational':
+        return sm.Rational(int(args[0]), int(args[1]))
+    if name == 'Float':
+        return sm.Float(str(args[0]), precision=int(args[1]))
+    if name == 'S':
+        obj = getattr(sm.S, str(args[0]), None)
+        if not isinstance(obj, sm.Basic):
+            raise ValueError(f'unknown sympy singleton {args[0]!r}')
+        return obj
+    cls = getattr(sm, str(name), None)
+    if not (isinstance(cls, type) and issubclass(cls, sm.Basic)):
+        raise ValueError(f'unknown sympy class {name!r}')
+    return cls(*[_from_tree(arg) for arg in args])
+
+def cached_solve(name, model, derive, args):
+    """ solve a model symbolically, or load the solution from the cache
+
+    The cache key covers the model, the arguments and the code of derive and of the functions of this
+    module it calls. Only the expressions are cached, as trees of sympy class names read back without
+    evaluating any text, see _from_tree(), and the NumPy functions are built from them. A cache file
+    which cannot be read, or whose expressions have symbols other than those of the model and args,
+    is solved again and replaced.
+
+    Args:
+
+        name (str): name of the model, used in the file name
+        model (sympy expression): the model being solved
+        derive (callable): derive(model) returns a dict of solved sympy expressions
+        args (dict): argument names of the compiled functions and the symbols they replace
+
+    Returns:
+
+        exprs (dict): solved sympy expressions
+        funcs (dict): compiled NumPy functions of the arguments in args
+
+    """
+
+    sm = _sympy()
+
+    # a. cache key
+    key = hashlib.sha256('|'.join([sm.__version__, sm.srepr(model), repr(list(args.items())),
+                                   _code_key(derive)]).encode()).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f'{name}-{key}.json')
+
+    # b. load, only symbols of the model and args reach the code generated by lambdify
+    exprs = None
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                exprs = {k: _from_tree(tree) for k, tree in json.load(f).items()}
+        except (ValueError, TypeError, KeyError, AttributeError):
+            exprs = None
+        allowed = model.free_symbols | set(args.values())
+        if exprs is not None and not all(expr.free_symbols <= allowed for expr in exprs.values()):
+            exprs = None
+
+    # c. or solve and store
+    if exprs is None:
+        exprs = derive(model)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({k: _to_tree(expr) for k, expr in exprs.items()}, f)
+        os.replace(tmp, path)
+
+    # d. NumPy functions of the arguments
+    funcs = {k: sm.lambdify(list(args.values()), expr, modules='numpy') for k, expr in exprs.items()}
+    return exprs, funcs
+
+
+### 1. Consumer theory
+
+# utility u(x_1, x_2) = 8 sqrt(x_1) + x_2 with prices p_1, p_2 and income I
+
+# x_2 as a function of x_1 for a given level of utility
 def x_2u(u,x_1):
     return (u- 8*np.sqrt(x_1))
 
-# %% [markdown]
-# We set $u_0$ to a list of set values:
-
-# %%
-u_0 = [19.96, 24.00, 27.96]
-
-# %% [markdown]
-# Now we draw 10.000 values of $x_1$ and create 3 empty vectors. These are used to graph the indifference curves at certain levels of utility as specified in u_0.
-
-# %%
-N = 10000
-
-x_1_vec = np.linspace(0.001,10,N)
-x_2_vec0 = np.empty(N)
-x_2_vec1 = np.empty(N)
-x_2_vec2 = np.empty(N)
-for i,x in enumerate(x_1_vec):
-    x_2_vec0[i] = x_2u(u_0[0], x)
-    x_2_vec1[i] = x_2u(u_0[1], x)
-    x_2_vec2[i] = x_2u(u_0[2], x)
-
-# %% [markdown]
-# Below we plot three indifference curves at the utility specified in u_0.
-
-# %%
-fig = plt.figure(figsize=(8,5))
-
-ax = fig.add_subplot(1,1,1)
-ax.plot(x_1_vec, x_2_vec0, color="red", label='$u_0 = 19.96$')
-ax.plot(x_1_vec, x_2_vec1, color="blue", label='$u_0 = 24.00$')
-ax.plot(x_1_vec, x_2_vec2, color="green", label='$u_0 = 27.96$')
-ax.grid(True)
-ax.set_ylabel('$x_2$')
-ax.set_xlabel('$x_1$')
-ax.legend(loc='upper right')
-plt.title("Figure 1: Indifference Curves")
-
-# %% [markdown]
-# We note from the indifference curves, that the consumer's preferences are both monotonic and convex.
-# %% [markdown]
-# **1.2 The utility maximization problem**
-# 
-# Now we wish to solve the utility maximization problem using the Lagrangian.
-# 
-# As such we have the following maximization problem:
-# 
-# $\max\limits_{x_1, x_2} 8 \sqrt{x_1} + x_2$ 
-# 
-# s.t. $p_1 x_1 + p_2 x_2 = I$
-# 
-# $\mathcal{L} = 8 \sqrt{x_1} + x_2 + \lambda [I - p_1 x_1 - p_2 x_2]$
-
-# %%
-#Define out variables using sympy.symbols
-I = sm.symbols('I')
-lam = sm.symbols('\lambda')
-p_1, p_2 = sm.symbols('p_1 p_2') 
-x_1, x_2 = sm.symbols('x_1 x_2')
-
-
-# %%
-#Define the maximization problem
-def lagrangian(x_1=x_1, x_2=x_2, lam = lam, I = I, p_1 = p_1, p_2 = p_2):
-    return 8*sqrt(x_1) + x_2 + lam * (I - p_1*x_1 - p_2*x_2)
-
-
-# %%
-#First order conditions w.r.t. the first good, second good and lambda. These are stored.
-FOC_x1 = diff(lagrangian(), x_1)
-FOC_x2 = diff(lagrangian(), x_2)
-FOC_lam = diff(lagrangian(), lam)
-
-
-# %%
-#Solve the first order conditions w.r.t. x_1 to lambda.
-eq1 = sm.solve(FOC_x1, lam)[0]
-eq1
-
-
-# %%
-#Solve the first order conditions w.r.t. x_2 to lambda.
-eq2 = sm.solve(FOC_x2, lam)[0]
-eq2
-
-
-# %%
-#Combining the eq1 and eq2 to find the optmial consumption of good 1.
-x_1_star = sm.solve((eq1-eq2), x_1)[0]
-x_1_star
-
-
-# %%
-#Define the budget constraint.
-def budget_constraint(x_1 = x_1, x_2 = x_2, I=I, p_1=p_1, p_2=p_2):
+def indifference_map(u, x_1):
+    """ indifference curves for a vector of utility levels
+
+    Args:
+
+        u (ndarray): utility levels, shape (n,)
+        x_1 (ndarray): consumption of good 1, shape (m,)
+
+    Returns:
+
+        x_2 (ndarray): consumption of good 2 giving utility u[i] at x_1[j], shape (n,m)
+
+    """
+
+    u = np.asarray(u, dtype=float).reshape(-1, 1)
+    return x_2u(u, np.asarray(x_1, dtype=float).reshape(1, -1))
+
+def budget_line(x_1, I, p_1, p_2):
+    """ consumption of good 2 on the budget line
+
+    Args:
+
+        x_1 (ndarray): consumption of good 1
+        I (float or ndarray): income
+        p_1 (float or ndarray): price of good 1
+        p_2 (float or ndarray): price of good 2
+
+    Returns:
+
+        x_2 (ndarray): consumption of good 2, broadcast over the arguments
+
+    """
+
+    return (I - p_1*np.asarray(x_1, dtype=float))/p_2
+
+# the maximization problem
+def lagrangian(x_1=None, x_2=None, lam=None, I=None, p_1=None, p_2=None):
+    x_1, x_2, lam, I, p_1, p_2 = _or_symbols(x_1=x_1, x_2=x_2, lam=lam, I=I, p_1=p_1, p_2=p_2)
+    return 8*_sympy().sqrt(x_1) + x_2 + lam * (I - p_1*x_1 - p_2*x_2)
+
+# the budget constraint
+def budget_constraint(x_1=None, x_2=None, I=None, p_1=None, p_2=None):
+    x_1, x_2, I, p_1, p_2 = _or_symbols(x_1=x_1, x_2=x_2, I=I, p_1=p_1, p_2=p_2)
     return I - p_1*x_1 - p_2*x_2
 
+def derive_consumer(L):
+    """ solve the consumer problem step by step, starting from the Lagrangian L """
+
+    sm = _sympy()
+    s = symbols()
+
+    # a. first order conditions w.r.t. the first good, second good and lambda
+    FOC_x1 = sm.diff(L, s.x_1)
+    FOC_x2 = sm.diff(L, s.x_2)
+    FOC_lam = sm.diff(L, s.lam)
+
+    # b. solve the first order conditions w.r.t. x_1 and x_2 to lambda
+    eq1 = sm.solve(FOC_x1, s.lam)[0]
+    eq2 = sm.solve(FOC_x2, s.lam)[0]
+
+    # c. combining eq1 and eq2 to find the optimal consumption of good 1
+    x_1_star = sm.solve((eq1-eq2), s.x_1)[0]
+
+    # d. inserting optimal consumption of good 1 in the budget constraint to solve optimal consumption of good 2
+    x_2_star = sm.solve(budget_constraint(x_1=x_1_star), s.x_2)[0]
+
+    # e. requirement for income, I, for an inner solution
+    I_boundry = sm.solve((x_2_star), s.I)[0]
+
+    return {'FOC_x1': FOC_x1, 'FOC_x2': FOC_x2, 'FOC_lam': FOC_lam, 'eq1': eq1, 'eq2': eq2,
+            'x_1_star': x_1_star, 'x_2_star': x_2_star, 'I_boundry': I_boundry}
+
+@functools.lru_cache(maxsize=None)
+@staged('symbolic_solve')
+def consumer_solution():
+    """ solved expressions and compiled functions of the consumer problem, see cached_solve() """
+    s = symbols()
+    return cached_solve('consumer', lagrangian(), derive_consumer,
+                        {'I': s.I, 'p_1': s.p_1, 'p_2': s.p_2, 'x_1': s.x_1, 'x_2': s.x_2, 'lam': s.lam})
+
+# utility function, NumPy version
+def utility_np(x_1, x_2):
+    return 8*np.sqrt(x_1) + x_2
+
+@staged('numeric_sweep')
+def consumer_np(I, p_1, p_2):
+    """ solve the consumer problem for arrays of income and prices
+
+    For I > 16 p_2^2/p_1 the solution is inner, x_1 = 16 p_2^2/p_1^2 and x_2 = I/p_2 - 16 p_2/p_1.
+    Otherwise, all income is spent on good 1.
+
+    Args:
+
+        I (ndarray): income
+        p_1 (ndarray): price of good 1
+        p_2 (ndarray): price of good 2
+
+    Returns:
+
+        x_1 (ndarray): optimal consumption of good 1
+        x_2 (ndarray): optimal consumption of good 2
+        u (ndarray): utility
+
+    """
+
+    I, p_1, p_2 = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (I, p_1, p_2)))
+    inner = I > 16*p_2**2/p_1
+    x_1 = np.where(inner, 16*p_2**2/p_1**2, I/p_1)
+    x_2 = np.where(inner, I/p_2 - 16*p_2/p_1, 0.0)
+    return x_1, x_2, utility_np(x_1, x_2)
+
+@staged('numeric_sweep')
+def consumer_bisect(I, p_1, p_2, u=utility_np, tol=1e-12, max_iter=200):
+    """ solve the consumer problem for arrays of income and prices by vectorized bisection
+
+    The derivative of utility along the budget line, du/dx_1 with x_2 = (I-p_1*x_1)/p_2, is
+    approximated by central differences and its root is bracketed in [0, I/p_1] for all
+    households at once. Corner solutions are found as the bracket collapses to a bound.
+
+    Args:
+
+        I (ndarray): income
+        p_1 (ndarray): price of good 1
+        p_2 (ndarray): price of good 2
+        u (callable): utility function u(x_1, x_2) working on arrays
+        tol (float): tolerance relative to I/p_1
+        max_iter (int): maximum number of bisections
+
+    Returns:
+
+        x_1 (ndarray): optimal consumption of good 1
+        x_2 (ndarray): optimal consumption of good 2
+        u (ndarray): utility
 
-# %%
-#Inserting optimal consumption of good 1 in the budget constraint to solve optimal consumption of good 2.
-x_2_star = sm.solve(budget_constraint(x_1=x_1_star), x_2)[0]
-x_2_star
-
-# %% [markdown]
-# We note, that we noly have an inner solution when:
-# 
-# $x_2^* > 0 \Leftrightarrow \frac{I}{p_2}-\frac{16 p_2}{p_1} > 0 \Leftrightarrow$
-
-# %%
-#Requiremt for income, I.
-I_boundry = sm.solve((x_2_star), I)[0]
-I_boundry
-
-# %% [markdown]
-# As such, we have an inner solution when the following applies for income, $I$:
-# 
-# $I > \frac{16 p_2^2}{p_1}$
-# %% [markdown]
-# **1.3 Consumption and utility at given parameter values**
-# 
-# The following analyzes the optimal consumption levels and consequential level of utility for given paramter values - both mathematically and graphically. First, we consider the following parameter values:
-# 
-# $I = 20$
-# 
-# $p_1 = 4$
-# 
-# $p_2 = 1$
-# %% [markdown]
-# Below we set the given parameter values. Using an optimizer we solve for the optimal consumption of the two goods, $x_1, x_2$ and the subsequent utility, $u$.
-
-# %%
-# a. choose parameters
-I_1 = 20
-p_1_1 = 4
-p_2_1 = 1
-
-# b. value-of-choice
-def value_of_choice(x_1_1, p_1_1, p_2_1, I_1):
-    x_2_1 = (I_1-p_1_1*x_1_1)/p_2_1
-    utility = 8*sqrt(x_1_1) + x_2_1
-    return utility
-
-# c. objective
-obj = lambda x_1_1: -value_of_choice(x_1_1, p_1_1, p_2_1, I_1)
-
-# d. solve
-solution = optimize.minimize_scalar(obj,bounds=(0,I_1/p_1_1))
-
-# e. result
-x_1_1 = solution.x
-x_2_1 = (I_1-x_1_1*p_1_1)/p_2_1
-utility_value_1 = 8*sqrt(x_1_1) + x_2_1
-print(f'Optimal consumption of good 1 and good 2 with given income and given prices is: {x_1_1:0.2} and {x_2_1:0.3}. This yields utility of {utility_value_1:0.2}')
-
-# %% [markdown]
-# The indifference curve for this level of utility along with the budget constraing is plotted below. We clearly see that the intersection of the budget constraint and indifference curve corresponds to the specified consumption bundle.
-
-# %%
-#Three empty vectores for good 1, good 2 and budget constraint, x_1 randomly drawn, N=10.000
-N = 10000
-x_1_vec = np.linspace(0.001,10,N)
-x_2_vec = np.empty(N)
-budgetconstraint_vec = np.empty(N)
-
-#Vector to plot indifference curve, utility = 24, given x_1 values. Budget constraint for given income and prices.
-for i,x in enumerate(x_1_vec):
-    x_2_vec[i] = x_2u(utility_value_1, x)
-    budgetconstraint_vec[i] = (I_1 - p_1_1 * x) / p_2_1
-
-
-# %%
-#Plotting the indifference curve and budget contraint.
-fig = plt.figure(figsize=(8,5))
-
-ax = fig.add_subplot(1,1,1)
-ax.plot(x_1_vec, x_2_vec, color="red", label='$u=24$')
-ax.plot(x_1_vec, budgetconstraint_vec, color="blue", label="Budget Constraint")
-
-ax.plot(x_1_1,x_2_1,ls='',marker='*',
-        markersize=12,markerfacecolor='yellow',
-        markeredgecolor='yellow',label='Intersection')
-
-ax.grid(True)
-ax.set_ylabel('$x_2$')
-ax.set_xlabel('$x_1$')
-ax.legend(loc='upper right')
-plt.title("Figure 2: Optimal Consumption At Utility of 24")
-
-# %% [markdown]
-# We note, the intersection between the indifference curve and budget constraint is the optimal solution found above. $x_1^*$ = 1, $x_2^* = 16$
-# %% [markdown]
-# Now we consider the following parameter values:
-# 
-# $I = 20$
-# 
-# $p_1 = 4$
-# 
-# $p_2 = 1$
-
-# %%
-# a. choose parameters
-I_2 = 17
-p_1_2 = 2
-p_2_2 = 1
-
-# b. value-of-choice
-def value_of_choice(x_1_2, p_1_2, p_2_2, I_2):
-    x_2_2 = (I_2-p_1_2*x_1_2)/p_2_2
-    utility = 8*sqrt(x_1_2) + x_2_2
-    return utility
-
-# c. objective
-obj = lambda x_1_2: -value_of_choice(x_1_2, p_1_2, p_2_2, I_2)
-
-# d. solve
-solution = optimize.minimize_scalar(obj,bounds=(0,I_2/p_1_2))
-
-# e. result
-x_1_2 = solution.x
-x_2_2 = (I_2-x_1_2*p_1_2)/p_2_2
-utility_value_2 = 8*sqrt(x_1_2) + x_2_2
-print(f'Optimal consumption of good 1 and good 2 with given income and given prices is: {x_1_2:0.2} and {x_2_2:0.2}. This yields utility of {utility_value_2:0.2}')
-
-# %% [markdown]
-# The indifference curve for this level of utility along with the budget constraing is plotted below. We clearly see that the intersection of the budget constraint and indifference curve corresponds to the specified consumption bundle.
-
-# %%
-#Three empty vectores for good 1, good 2 and budget constraint, x_1 randomly drawn, N=10.000
-N = 10000
-
-x_1_vec = np.linspace(0.001,10,N)
-x_2_vec = np.empty(N)
-budgetconstraint_vec = np.empty(N)
-
-#Vector to plot indifference curve, utility = 24, given x_1 values. Budget constraint for given income and prices.
-for i,x in enumerate(x_1_vec):
-    x_2_vec[i] = x_2u(utility_value_2, x)
-    budgetconstraint_vec[i] = (I_2 - p_1_2 * x) / p_2_2
-
-
-# %%
-#Plotting the indifference curve and budget contraint.
-fig = plt.figure(figsize=(8,5))
-
-ax = fig.add_subplot(1,1,1)
-ax.plot(x_1_vec, x_2_vec, color="red", label='$u=25$')
-ax.plot(x_1_vec, budgetconstraint_vec, color="blue", label="Budget Constraint")
-
-ax.plot(x_1_2,x_2_2,ls='',marker='*',
-        markersize=12,markerfacecolor='yellow',
-        markeredgecolor='yellow',label='Intersection')
-
-ax.grid(True)
-ax.set_ylabel('$x_2$')
-ax.set_xlabel('$x_1$')
-ax.legend(loc='upper right')
-plt.title("Figure 3: Optimal Consumption At Utility of 25")
-
-# %% [markdown]
-# We note, that despite a lower income $(I^2 = 17< I^1 = 20)$ in the second case, the lower price of good 1 $(p_1^2 = 2 < p_1^1 = 4)$ secures higher utility in case 2. More so, we note a substitution in consumption towards the now cheaper good 1.
-# %% [markdown]
-# ### 2. Production
-# 
-# Consider a firm that produces a good, $x$, with two inputs, capital $k$, and labour $l$. The productionfunction is as follows:
-# 
-# $x = f(l,k) = l^{1/4} k^{1/4}$
-# 
-# Assume the price of labour $(w > 0)$, the price of capital $(r > 0)$ and the price of the good $(p>0)$ and all given exogonously. The firm has fixed costs, $FC≥0$. It can be shown that the conditional factor demands for labour, $l$, and capital, $k$, are as follows:
-# 
-# $l_b^*(x,w,r) = \frac{\sqrt{r}}{\sqrt{w}}x^2$
-# 
-# $c_b^*(x,w,r) = \frac{\sqrt{w}}{\sqrt{r}}x^2$
-# 
-# Hence the firm's cost function is given by:
-# 
-# $C(x,w,r)=w l_b^*(x,w,r) + r c_b^*(x,w,r) + FC = 2 \cdot \sqrt{wr} x^2 + FC$
-# %% [markdown]
-# **2.1 Profit maximization**
-
-# %%
-#Define the variables using sympy.symbols.
-x = sm.symbols('x')
-l = sm.symbols('l')
-k = sm.symbols('k') 
-w = sm.symbols('w')
-r = sm.symbols('r')
-FC = sm.symbols('FC')
-p = sm.symbols('p')
-
-
-# %%
-#Define the cost function.
-def cost_func(x=x,w=w,r=r,FC=FC):
-    return 2*sqrt(w*r)*x**2 + FC
-
-
-# %%
-#Define the profit function.
-def profit(p=p, x=x, w=w, r=r, FC=FC, cost=cost_func()):
+    """
+
+    I, p_1, p_2 = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (I, p_1, p_2)))
+    x_1_max = I/p_1
+    lo = np.zeros_like(x_1_max)
+    hi = x_1_max.copy()
+
+    value = lambda x_1: u(x_1, (I - p_1*x_1)/p_2)
+    for _ in range(max_iter):
+        mid = (lo + hi)/2
+        h = np.minimum(1e-6*x_1_max, np.minimum(mid, x_1_max - mid))
+        h = np.where(h > 0, h, 1e-12)
+        slope = value(mid + h) - value(mid - h)
+        up = slope > 0
+        lo = np.where(up, mid, lo)
+        hi = np.where(up, hi, mid)
+        if np.all(hi - lo <= tol*x_1_max):
+            break
+
+    x_1 = (lo + hi)/2
+    x_2 = (I - p_1*x_1)/p_2
+    return x_1, x_2, u(x_1, x_2)
+
+
+# market demand of a population with utility a sqrt(x_1) + x_2, drawn income I and preference a
+
+def demand_1(I, p_1, p_2, a=8):
+    """ demand for good 1, x_1 = a^2 p_2^2/(4 p_1^2) if I > a^2 p_2^2/(4 p_1) and x_1 = I/p_1 otherwise """
+    return np.minimum(a**2*p_2**2/(4*p_1**2), I/p_1)
+
+def surplus_1(I, p_1, p_2, a=8):
+    """ consumer surplus of good 1, the area under the demand curve above p_1
+
+    Above the price q_c = a^2 p_2^2/(4 I) demand is inner and the area is a^2 p_2^2/(4 max(p_1, q_c)).
+    Below q_c all income is spent on good 1 and the area is I ln(q_c/p_1).
+
+    """
+    q_c = a**2*p_2**2/(4*I)
+    return a**2*p_2**2/(4*np.maximum(p_1, q_c)) + I*np.log(np.maximum(q_c/p_1, 1))
+
+# market demand is summed over chunks of consumers drawn independently of each other
+MARKET_CHUNK_SIZE = 2**20
+
+def _market_chunk(seed, n, p_1, p_2, income, pref):
+    """ draw n consumers and sum their demand, surplus and corner solutions at each price in p_1 """
+
+    # a. draws, log-normal with the given median and standard deviation of the log
+    rng = np.random.default_rng(seed)
+    I = income[0]*np.exp(income[1]*rng.standard_normal(n))
+    a = pref[0]*np.exp(pref[1]*rng.standard_normal(n))
+
+    # b. sums at each price, one price at a time to keep memory at a few vectors of the chunk
+    demand, surplus, corner = np.zeros(p_1.size), np.zeros(p_1.size), np.zeros(p_1.size)
+    for j, price in enumerate(p_1):
+        x_1 = demand_1(I, price, p_2, a)
+        demand[j] = x_1.sum()
+        surplus[j] = surplus_1(I, price, p_2, a).sum()
+        corner[j] = np.count_nonzero(I <= a**2*p_2**2/(4*price))
+    return demand, surplus, corner
+
+@staged('numeric_sweep')
+def market_demand(p_1, p_2=1, n=10**7, income=(20, 0.5), pref=(8, 0.2), seed=0,
+                  chunk_size=MARKET_CHUNK_SIZE, workers=None):
+    """ Monte Carlo market demand for good 1 and consumer surplus
+
+    The population is never held in memory. Consumers are drawn in chunks of chunk_size, each with its
+    own random stream spawned from seed, and the chunks are summed in a process pool. The results
+    therefore only depend on seed and chunk_size, not on the number of workers.
+
+    Args:
+
+        p_1 (ndarray): grid of prices of good 1
+        p_2 (float): price of good 2
+        n (int): number of consumers, at least 1
+        income (tuple): median and standard deviation of log income
+        pref (tuple): median and standard deviation of the log of a in a sqrt(x_1) + x_2, (8, 0) is the model above
+        seed (int): seed of the draws
+        chunk_size (int): consumers per chunk
+        workers (int): number of processes, default is all cores, 1 sums in this process
+
+    Returns:
+
+        market (dict): for each price in 'p_1', market 'demand' for good 1, consumer 'surplus'
+            of good 1 and the 'corner' share of consumers spending all income on good 1
+
+    """
+
+    if n < 1:
+        raise ValueError(f'n must be at least 1, got {n}')
+    p_1 = np.atleast_1d(np.asarray(p_1, dtype=float))
+    sizes = [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [(s, size, p_1, float(p_2), tuple(income), tuple(pref)) for s, size in zip(seeds, sizes)]
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 1 or len(chunks) == 1:
+        sums = [_market_chunk(*chunk) for chunk in chunks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            sums = executor.map(_market_chunk, *zip(*chunks))
+            sums = list(sums)
+
+    demand, surplus, corner = (np.sum(parts, axis=0) for parts in zip(*sums))
+    return {'p_1': p_1, 'demand': demand, 'surplus': surplus, 'corner': corner/n}
+
+
+# comparative statics: Marshallian and Hicksian demand, Slutsky decomposition and welfare measures
+
+def closed_forms():
+    """ NumPy functions of I, p_1 and p_2 for x_1_star, x_2_star and I_boundry, from the symbolic solution """
+    funcs = consumer_solution()[1]
+    return {name: functools.partial(lambda f, I, p_1, p_2: f(I, p_1, p_2, 0, 0, 0), funcs[name])
+            for name in ['x_1_star', 'x_2_star', 'I_boundry']}
+
+def marshallian(I, p_1, p_2, forms=None):
+    """ Marshallian demand, the inner solution x_1_star, x_2_star if I > I_boundry and x_1 = I/p_1, x_2 = 0 otherwise
+
+    Args:
+
+        I (ndarray): income
+        p_1 (ndarray): price of good 1
+        p_2 (ndarray): price of good 2
+        forms (dict): closed forms, default is closed_forms()
+
+    Returns:
+
+        x_1 (ndarray): demand for good 1
+        x_2 (ndarray): demand for good 2
+
+    """
+
+    forms = closed_forms() if forms is None else forms
+    inner = I > forms['I_boundry'](I, p_1, p_2)
+    x_1 = np.where(inner, forms['x_1_star'](I, p_1, p_2), I/p_1)
+    x_2 = np.where(inner, forms['x_2_star'](I, p_1, p_2), 0.0)
+    return x_1, x_2
+
+def expenditure(u, p_1, p_2, forms=None):
+    """ minimum expenditure reaching utility u
+
+    At an inner solution good 1 is consumed at x_1_star, which does not depend on income, and good 2
+    makes up the rest of the utility, x_2 = x_2u(u, x_1_star). Otherwise only good 1 is consumed, x_1 = (u/8)^2.
+
+    """
+
+    forms = closed_forms() if forms is None else forms
+    x_1 = forms['x_1_star'](0, p_1, p_2)
+    e_inner = p_1*x_1 + p_2*x_2u(u, x_1)
+    return np.where(e_inner > forms['I_boundry'](0, p_1, p_2), e_inner, p_1*(u/8)**2)
+
+def hicksian(u, p_1, p_2, forms=None):
+    """ Hicksian demand, the Marshallian demand at the minimum expenditure reaching utility u """
+    forms = closed_forms() if forms is None else forms
+    return marshallian(expenditure(u, p_1, p_2, forms), p_1, p_2, forms)
+
+@staged('numeric_sweep')
+def comparative_statics(I_0, p_1_0, p_2_0, I_1, p_1_1, p_2_1, compensation='hicks', forms=None):
+    """ compare scenario 0 and 1 for grids of prices and income in one vectorized pass
+
+    The change in demand is split in a substitution effect, the change at compensated income, and an income
+    effect. With compensation='hicks' income is compensated to keep the utility of scenario 0, with 'slutsky'
+    to keep the bundle of scenario 0 affordable. The compensating variation is the income that can be taken
+    away in scenario 1 to keep the utility of scenario 0, I_1 - e(p_1, u_0), and the equivalent variation the
+    income needed in scenario 0 to reach the utility of scenario 1, e(p_0, u_1) - I_0.
+
+    Args:
+
+        I_0 (ndarray): income in scenario 0
+        p_1_0 (ndarray): price of good 1 in scenario 0
+        p_2_0 (ndarray): price of good 2 in scenario 0
+        I_1 (ndarray): income in scenario 1
+        p_1_1 (ndarray): price of good 1 in scenario 1
+        p_2_1 (ndarray): price of good 2 in scenario 1
+        compensation (str): 'hicks' or 'slutsky'
+        forms (dict): closed forms, default is closed_forms()
+
+    Returns:
+
+        cs (dict): demand 'x_1_0', 'x_2_0', 'x_1_1', 'x_2_1' and utility 'u_0', 'u_1' in the scenarios,
+            compensated demand 'h_1', 'h_2', for each good 'total_i', 'substitution_i' and 'income_i' effects,
+            and 'cv' and 'ev', all broadcast to a common shape
+
+    """
+
+    forms = closed_forms() if forms is None else forms
+    I_0, p_1_0, p_2_0, I_1, p_1_1, p_2_1 = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (I_0, p_1_0, p_2_0, I_1, p_1_1, p_2_1)))
+
+    # a. the scenarios
+    x_1_0, x_2_0 = marshallian(I_0, p_1_0, p_2_0, forms)
+    x_1_1, x_2_1 = marshallian(I_1, p_1_1, p_2_1, forms)
+    u_0, u_1 = utility_np(x_1_0, x_2_0), utility_np(x_1_1, x_2_1)
+
+    # b. compensated demand at the prices of scenario 1
+    e_1 = expenditure(u_0, p_1_1, p_2_1, forms)
+    if compensation == 'hicks':
+        h_1, h_2 = marshallian(e_1, p_1_1, p_2_1, forms)
+    elif compensation == 'slutsky':
+        h_1, h_2 = marshallian(p_1_1*x_1_0 + p_2_1*x_2_0, p_1_1, p_2_1, forms)
+    else:
+        raise ValueError(f"compensation must be 'hicks' or 'slutsky', not {compensation!r}")
+
+    # c. decomposition and welfare
+    cs = {'x_1_0': x_1_0, 'x_2_0': x_2_0, 'x_1_1': x_1_1, 'x_2_1': x_2_1, 'u_0': u_0, 'u_1': u_1,
+          'h_1': h_1, 'h_2': h_2}
+    for i, (x_0, x_1, h) in enumerate([(x_1_0, x_1_1, h_1), (x_2_0, x_2_1, h_2)], start=1):
+        cs[f'total_{i}'] = x_1 - x_0
+        cs[f'substitution_{i}'] = h - x_0
+        cs[f'income_{i}'] = x_1 - h
+    cs['cv'] = I_1 - e_1
+    cs['ev'] = expenditure(u_1, p_1_0, p_2_0, forms) - I_0
+    return cs
+
+
+### 2. Production
+
+# production x = l^(1/4) k^(1/4) with prices w (labour), r (capital), p (output) and fixed costs FC
+
+# the cost function
+def cost_func(x=None, w=None, r=None, FC=None):
+    x, w, r, FC = _or_symbols(x=x, w=w, r=r, FC=FC)
+    return 2*_sympy().sqrt(w*r)*x**2 + FC
+
+# the profit function
+def profit(p=None, x=None, w=None, r=None, FC=None, cost=None):
+    p, x, w, r, FC = _or_symbols(p=p, x=x, w=w, r=r, FC=FC)
+    if cost is None:
+        cost = cost_func()
     return p*x - cost
 
+# optimal quantity
+def q(p=None, r=None, w=None):
+    p, r, w = _or_symbols(p=p, r=r, w=w)
+    return p/(4*_sympy().sqrt(r*w))
 
-# %%
-#First order condition w.r.t. quantity, x
-FOC_x = diff(profit(), x)
-
-FOC_x
-
-
-# %%
-#Optimal quantity by solving the first order condition above for x
-quan = sm.solve(FOC_x, x)[0]
-quan
-
-# %% [markdown]
-# As such, we have the following for $x$:
-# 
-# $x = \frac{p}{4\sqrt{rw}}$
-# 
-# This yields the following profit:
-
-# %%
-#cost_1 is the total cost, when inserting the solution for quantity, x.
-cost_1 = cost_func(x=quan,w=w,r=r,FC=FC)
-
-
-# %%
-#Profit given the cost function and quantity above.
-profit(p=p, x=quan, w=w, r=r, FC=FC, cost=cost_1)
-simplify(profit(p=p, x=quan, w=w, r=r, FC=FC, cost=cost_1))
-
-# %% [markdown]
-# As such, the firm has a positive profit when the fixed costs are not too large:
-# 
-# $FC < \frac{p^2}{8\sqrt{rw}}$
-# %% [markdown]
-# **2.2 Optimal setting given parameter values**
-# 
-# For the following we assume the parameter values:
-# 
-# $p = 80 $
-# 
-# $w = 4 $
-# 
-# $ r = 1 $
-# 
-# $FC = 100$
-
-# %%
-#Set parameter values.
-p_1 = 80
-w_1 = 4
-r_1 = 1
-FC_1 = 100
-
-
-# %%
-#Define optimal quantity as found in 2.1.
-def q(p=p, r=r, w=w):
-    return p/(4*sqrt(r*w))
-
-
-# %%
-#Define optimal conditional demand for labour.
-def fac_dem_l(w=w,r=r,x=x):
+# optimal conditional demand for labour
+def fac_dem_l(w=None, r=None, x=None):
+    w, r, x = _or_symbols(w=w, r=r, x=x)
+    sqrt = _sympy().sqrt
     return sqrt(r)/sqrt(w)*x**2
 
-
-# %%
-#Define optimal conditional demand for capital.
-def fac_dem_k(w=w,r=r,x=x):
+# optimal conditional demand for capital
+def fac_dem_k(w=None, r=None, x=None):
+    w, r, x = _or_symbols(w=w, r=r, x=x)
+    sqrt = _sympy().sqrt
     return (sqrt(w)/sqrt(r))*(x**2)
 
+def derive_firm(profit_expr):
+    """ solve the firm's problem step by step, starting from the profit function """
+
+    sm = _sympy()
+    s = symbols()
+
+    # a. first order condition w.r.t. quantity, x
+    FOC_x = sm.diff(profit_expr, s.x)
+
+    # b. optimal quantity by solving the first order condition above for x
+    quan = sm.solve(FOC_x, s.x)[0]
+
+    # c. total cost and profit, when inserting the solution for quantity, x
+    cost_1 = cost_func(x=quan)
+    profit_star = sm.simplify(profit(x=quan, cost=cost_1))
+
+    return {'FOC_x': FOC_x, 'quan': quan, 'cost_1': cost_1, 'profit_star': profit_star}
+
+@functools.lru_cache(maxsize=None)
+@staged('symbolic_solve')
+def firm_solution():
+    """ solved expressions and compiled functions of the firm's problem, see cached_solve() """
+    s = symbols()
+    return cached_solve('firm', profit(), derive_firm,
+                        {'p': s.p, 'x': s.x, 'w': s.w, 'r': s.r, 'FC': s.FC})
+
+# NumPy versions of the functions above, these take scalars or arrays (broadcast against each other)
+
+# optimal quantity, NumPy version
+def q_np(p, r, w):
+    return p/(4*np.sqrt(r*w))
+
+# optimal conditional demand for labour, NumPy version
+def fac_dem_l_np(w, r, x):
+    return np.sqrt(r)/np.sqrt(w)*x**2
+
+# optimal conditional demand for capital, NumPy version
+def fac_dem_k_np(w, r, x):
+    return (np.sqrt(w)/np.sqrt(r))*(x**2)
+
+# marginal cost, NumPy version
+def mc_np(x, w, r):
+    return 4*np.sqrt(w*r)*x
+
+# cost function, NumPy version
+def cost_func_np(x, w, r, FC):
+    return 2*np.sqrt(w*r)*x**2 + FC
+
+# profit function, NumPy version, if no cost is given it is computed from the cost function
+def profit_np(p, x, w, r, FC, cost=None):
+    if cost is None:
+        cost = cost_func_np(x=x, w=w, r=r, FC=FC)
+    return p*x - cost
+
+@staged('numeric_sweep')
+def firm_np(p, w, r, FC):
+    """ solve the firm's problem for arrays of parameters
+
+    Args:
+
+        p (ndarray): output price
+        w (ndarray): price of labour
+        r (ndarray): price of capital
+        FC (ndarray): fixed costs
+
+    Returns:
+
+        sol (dict): quantity 'x', factor demands 'l' and 'k', cost 'cost' and profit 'profit', broadcast to a common shape
+
+    """
+
+    p, w, r, FC = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (p, w, r, FC)))
+    x = q_np(p=p, r=r, w=w)
+    cost = cost_func_np(x=x, w=w, r=r, FC=FC)
+    return {'x': x,
+            'l': fac_dem_l_np(w=w, r=r, x=x),
+            'k': fac_dem_k_np(w=w, r=r, x=x),
+            'cost': cost,
+            'profit': profit_np(p=p, x=x, w=w, r=r, FC=FC, cost=cost)}
+
+# outputs of firm_sweep(), in the order of firm_np()
+FIRM_SWEEP_OUTPUTS = ['x', 'l', 'k', 'cost', 'profit']
+
+def _firm_sweep_chunk(folder, p, w, r, FC, start, stop):
+    """ solve the firm's problem for grid points start:stop and write them to the files in folder """
+
+    # a. parameters of the chunk
+    idx = np.unravel_index(np.arange(start, stop), (p.size, w.size, r.size, FC.size))
+    sol = firm_np(p=p[idx[0]], w=w[idx[1]], r=r[idx[2]], FC=FC[idx[3]])
+
+    # b. write to the output files
+    for name in FIRM_SWEEP_OUTPUTS:
+        out = np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r+')
+        out.reshape(-1)[start:stop] = sol[name]
+        out.flush()
+        del out
+
+    return int(np.count_nonzero(sol['profit'] > 0))
 
-# %%
-#Storing quantity, conditional factor demands, cost and profit given paramter values and optimal solutions.
-quan_1 = q(p=p_1, r=r_1, w=w_1)
-demand_l = fac_dem_l(w=w_1,r=r_1,x=quan_1)
-demand_k = fac_dem_k(w=w_1,r=r_1,x=quan_1)
-total_cost = cost_func(x=quan_1,w=w_1,r=r_1,FC=FC_1)
-profit_1 = profit(p=p_1, x=quan_1, w=w_1, r=r_1, FC=FC_1, cost=total_cost)
-
-print(f'The firm produces the amount x: {q(p=p_1, r=r_1, w=w_1)} with conditional labour demand: {demand_l} and conditional captial demand: {demand_k}.')
-print(f'This yields total costs of {total_cost} and profits of {profit_1}.')
-
-# %% [markdown]
-# **2.3 Plotting costs and profit given set paramter values**
-
-# %%
-#Three empty vectores for profit, marginal cost and total cost. Quantity x randomly drawn, N=10.000
-N = 10000
-x_vec = np.linspace(0.001,20,N)
-profit_vec = np.empty(N)
-mc_vec = np.empty(N)
-tc_vec = np.empty(N)
-
-#Marginal cost, total cost and profit.
-for i,x_1 in enumerate(x_vec):
-    mc_vec[i] = 4*sqrt(w_1*r_1)*x_1
-    tc_vec[i] = cost_func(x=x_1,w=w_1,r=r_1,FC=FC_1)
-    profit_vec[i] = profit(p=p_1, x=x_1, w=w_1, r=r_1, FC=FC_1, cost=cost_func(x=x_1,w=w_1,r=r_1,FC=FC_1))
-
-
-# %%
-#Plotting profit, marginal cost and total cost - given parameter values above.
-fig = plt.figure(figsize=(8,5))
-
-ax = fig.add_subplot(1,1,1)
-ax.plot(x_vec, profit_vec, color="red", label='Profit')
-ax.plot(x_vec, mc_vec, color="blue", label="Marginal Cost")
-ax.plot(x_vec, tc_vec, color="green", label="Total Cost")
-ax.plot(quan_1,profit_1,ls='',marker='*',
-        markersize=12,markerfacecolor='yellow',
-        markeredgecolor='yellow',label='Optimal Quantity')
-
-ax.grid(True)
-ax.set_ylabel('$\Pi, c$')
-ax.set_xlabel('$x$')
-ax.legend(loc='upper right')
-plt.title("Figure 4: Cost & Profit at Given Parameter Values")
-
-# %% [markdown]
-# We note, the optimal quantity corresponds to the solution found in 2.2. I.e. the optimal quantity produced is $x=10$. This yields a profit of 300 and total costs of 500.
+@staged('numeric_sweep')
+def firm_sweep(p, w, r, FC, folder, chunk_size=2**20, workers=None):
+    """ solve the firm's problem on the grid of all combinations of p, w, r and FC
 
+    The grid is split in chunks of chunk_size points, which are solved in a process pool
+    and written directly to one memory-mapped .npy file per output in folder. Only one chunk
+    per worker is held in memory.
+
+    Args:
+
+        p (ndarray): output prices
+        w (ndarray): prices of labour
+        r (ndarray): prices of capital
+        FC (ndarray): fixed costs
+        folder (str): folder for the output files
+        chunk_size (int): number of grid points per chunk
+        workers (int): number of processes, default is all cores, 1 solves in this process
+
+    Returns:
+
+        sol (dict): read-only memory-mapped arrays of shape (p.size, w.size, r.size, FC.size) for
+            each output in FIRM_SWEEP_OUTPUTS, and 'positive', the number of grid points with positive profit
+
+    """
+
+    p, w, r, FC = (np.asarray(a, dtype=float).ravel() for a in (p, w, r, FC))
+    shape = (p.size, w.size, r.size, FC.size)
+    size = int(np.prod(shape))
+
+    # a. allocate output files
+    os.makedirs(folder, exist_ok=True)
+    for name in FIRM_SWEEP_OUTPUTS:
+        np.lib.format.open_memmap(os.path.join(folder, f'{name}.npy'), mode='w+', dtype=float, shape=shape).flush()
+
+    # b. solve chunks
+    chunks = [(folder, p, w, r, FC, start, min(start+chunk_size, size)) for start in range(0, size, chunk_size)]
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 1:
+        positive = sum(_firm_sweep_chunk(*chunk) for chunk in chunks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            positive = sum(executor.map(_firm_sweep_chunk, *zip(*chunks)))
+
+    # c. results
+    sol = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in FIRM_SWEEP_OUTPUTS}
+    sol['positive'] = positive
+    return sol
+
+
+### Results of modelproject.ipynb
+
+if __name__ == '__main__':
+
+    plt = _pyplot()
+
+    print(f'import modelproject takes {import_time(budget=None):.3f}s (budget {IMPORT_TIME_BUDGET}s)')
+
+    # 1.1 indifference curves at three levels of utility
+    u_0 = [19.96, 24.00, 27.96]
+
+    N = 10000
+    x_1_vec = np.linspace(0.001,10,N)
+    x_2_vec0, x_2_vec1, x_2_vec2 = indifference_map(u_0, x_1_vec)
+
+    fig = plt.figure(figsize=(8,5))
+    ax = fig.add_subplot(1,1,1)
+    ax.plot(x_1_vec, x_2_vec0, color="red", label='$u_0 = 19.96$')
+    ax.plot(x_1_vec, x_2_vec1, color="blue", label='$u_0 = 24.00$')
+    ax.plot(x_1_vec, x_2_vec2, color="green", label='$u_0 = 27.96$')
+    ax.grid(True)
+    ax.set_ylabel('$x_2$')
+    ax.set_xlabel('$x_1$')
+    ax.legend(loc='upper right')
+    ax.set_title("Figure 1: Indifference Curves")
+
+    # 1.2 the utility maximization problem
+    consumer_exprs, consumer_funcs = consumer_solution()
+    for name in ['eq1', 'eq2', 'x_1_star', 'x_2_star', 'I_boundry']:
+        print(f'{name} = {consumer_exprs[name]}')
+
+    # 1.3 consumption and utility at given parameter values
+    for fig_no, (I_1, p_1_1, p_2_1) in zip([2, 3], [(20, 4, 1), (17, 2, 1)]):
+
+        x_1_1, x_2_1, utility_value_1 = (float(v) for v in consumer_np(I_1, p_1_1, p_2_1))
+        print(f'Optimal consumption of good 1 and good 2 with given income and given prices is: {x_1_1:0.2} and {x_2_1:0.3}. This yields utility of {utility_value_1:0.3}')
+
+        x_2_vec = indifference_map([utility_value_1], x_1_vec)[0]
+        budgetconstraint_vec = budget_line(x_1_vec, I_1, p_1_1, p_2_1)
+
+        fig = plt.figure(figsize=(8,5))
+        ax = fig.add_subplot(1,1,1)
+        ax.plot(x_1_vec, x_2_vec, color="red", label=f'$u={utility_value_1:.0f}$')
+        ax.plot(x_1_vec, budgetconstraint_vec, color="blue", label="Budget Constraint")
+        ax.plot(x_1_1,x_2_1,ls='',marker='*',
+                markersize=12,markerfacecolor='yellow',
+                markeredgecolor='yellow',label='Intersection')
+        ax.grid(True)
+        ax.set_ylabel('$x_2$')
+        ax.set_xlabel('$x_1$')
+        ax.legend(loc='upper right')
+        ax.set_title(f"Figure {fig_no}: Optimal Consumption At Utility of {utility_value_1:.0f}")
+
+    # 1.4 from scenario 1 to 2 utility rises, the fall in p_1 is worth more than the loss of income
+    cs = comparative_statics(20, 4, 1, 17, 2, 1)
+    print(f"Good 1: total effect {cs['total_1']:.0f} = substitution effect {cs['substitution_1']:.0f} + income effect {cs['income_1']:.0f}")
+    print(f"Good 2: total effect {cs['total_2']:.0f} = substitution effect {cs['substitution_2']:.0f} + income effect {cs['income_2']:.0f}")
+    print(f"Compensating variation {cs['cv']:.2f} and equivalent variation {cs['ev']:.2f}")
+
+    # 1.5 market demand and consumer surplus of 10^6 consumers with drawn incomes and preferences
+    market = market_demand(p_1=[1, 2, 4], p_2=1, n=10**6)
+    for price, demand, surplus, corner in zip(market['p_1'], market['demand'], market['surplus'], market['corner']):
+        print(f'p_1 = {price:.0f}: market demand {demand:,.0f}, consumer surplus {surplus:,.0f}, corner share {corner:.2f}')
+
+    # 2.1 profit maximization
+    firm_exprs, firm_funcs = firm_solution()
+    for name in ['FOC_x', 'quan', 'profit_star']:
+        print(f'{name} = {firm_exprs[name]}')
+
+    # 2.2 optimal setting given parameter values
+    p_1 = 80
+    w_1 = 4
+    r_1 = 1
+    FC_1 = 100
+
+    quan_1 = q(p=p_1, r=r_1, w=w_1)
+    demand_l = fac_dem_l(w=w_1,r=r_1,x=quan_1)
+    demand_k = fac_dem_k(w=w_1,r=r_1,x=quan_1)
+    total_cost = cost_func(x=quan_1,w=w_1,r=r_1,FC=FC_1)
+    profit_1 = profit(p=p_1, x=quan_1, w=w_1, r=r_1, FC=FC_1, cost=total_cost)
+
+    print(f'The firm produces the amount x: {quan_1} with conditional labour demand: {demand_l} and conditional captial demand: {demand_k}.')
+    print(f'This yields total costs of {total_cost} and profits of {profit_1}.')
+
+    # the NumPy path returns the same numbers as the symbolic path
+    firm_1 = firm_np(p=p_1, w=w_1, r=r_1, FC=FC_1)
+    assert np.allclose([firm_1['x'], firm_1['l'], firm_1['k'], firm_1['cost'], firm_1['profit']],
+                       [float(quan_1), float(demand_l), float(demand_k), float(total_cost), float(profit_1)])
+
+    # 2.3 plotting costs and profit given set parameter values
+    x_vec = np.linspace(0.001,20,N)
+    mc_vec = mc_np(x=x_vec, w=w_1, r=r_1)
+    tc_vec = cost_func_np(x=x_vec, w=w_1, r=r_1, FC=FC_1)
+    profit_vec = profit_np(p=p_1, x=x_vec, w=w_1, r=r_1, FC=FC_1, cost=tc_vec)
+
+    fig = plt.figure(figsize=(8,5))
+    ax = fig.add_subplot(1,1,1)
+    ax.plot(x_vec, profit_vec, color="red", label='Profit')
+    ax.plot(x_vec, mc_vec, color="blue", label="Marginal Cost")
+    ax.plot(x_vec, tc_vec, color="green", label="Total Cost")
+    ax.plot(float(quan_1),float(profit_1),ls='',marker='*',
+            markersize=12,markerfacecolor='yellow',
+            markeredgecolor='yellow',label='Optimal Quantity')
+    ax.grid(True)
+    ax.set_ylabel('$\\Pi, c$')
+    ax.set_xlabel('$x$')
+    ax.legend(loc='upper right')
+    ax.set_title("Figure 4: Cost & Profit at Given Parameter Values")
+
+    plt.show()
+
+    if instrumentation.PROFILE:
+        path = os.environ['MODELPROJECT_PROFILE']
+        stage_report(path if path.endswith('.json') else None)